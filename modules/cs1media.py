@@ -5,19 +5,145 @@
 #
 # 2010/03/24 Otfried Cheong
 # 2010/09/02: Convert image to RGB on loading
+# 2026/10/18: Bulk access to rows, columns, and regions
 #
 # Inspired and using some code from picture.py by Mark Guzdial.
 #
 # On Linux, need packages python-tk, python-imaging-tk
+# (only for showing images and for the file and color choosers)
 #
 
 import sys as _sys
+import contextlib as _contextlib
+import mmap as _mmap
+import tempfile as _tempfile
+import weakref as _weakref
+from timeit import default_timer as _timer
+from collections import OrderedDict as _OrderedDict
 import Image as _Image
-import ImageTk as _ImageTk
-import easygui as _easygui
-import tkColorChooser as _tkColorChooser
-import tkFont as _tkFont
-import Tkinter as _Tk
+import ImageChops as _ImageChops
+import ImageDraw as _ImageDraw
+import ImageMath as _ImageMath
+import ImageStat as _ImageStat
+
+# The user interface modules are slow to import and need a display,
+# so they are only imported when first needed, by _load_gui.
+_ImageTk = None
+_easygui = None
+_tkColorChooser = None
+_tkFont = None
+_Tk = None
+
+# NumPy is optional, it is only needed for the array functions
+try:
+  import numpy as _np
+except ImportError:
+  _np = None
+
+# --------------------------------------------------------------------
+
+# PIL renamed tostring/fromstring to tobytes/frombytes
+
+def _tobytes(img):
+  if hasattr(img, "tobytes"):
+    return img.tobytes()
+  return img.tostring()
+
+def _frombytes(mode, size, data):
+  if hasattr(_Image, "frombytes"):
+    return _Image.frombytes(mode, size, data)
+  return _Image.fromstring(mode, size, data)
+
+def _load_gui():
+  global _ImageTk, _easygui, _tkColorChooser, _tkFont, _Tk
+  if _Tk is None:
+    import ImageTk, easygui, tkColorChooser, tkFont, Tkinter
+    _ImageTk = ImageTk
+    _easygui = easygui
+    _tkColorChooser = tkColorChooser
+    _tkFont = tkFont
+    _Tk = Tkinter
+
+def _strip_height(width):
+  # rows per strip when streaming an image, about 64K pixels
+  return max(1, 65536 // max(width, 1))
+
+def _need_numpy():
+  if _np is None:
+    raise RuntimeError("This operation requires NumPy.")
+
+def _array_to_image(a):
+  _need_numpy()
+  a = _np.asarray(a)
+  if a.dtype != _np.uint8:
+    a = _np.clip(a, 0, 255).astype(_np.uint8)
+  a = _np.ascontiguousarray(a)
+  if a.ndim == 2:
+    h, w = a.shape
+    img = _Image.frombuffer("L", (w, h), a, "raw", "L", 0, 1)
+    return img.convert("RGB")
+  if a.ndim != 3 or a.shape[2] != 3:
+    raise ValueError("Array must have shape (height, width, 3) or "
+                     "(height, width), not " + str(a.shape))
+  h, w = a.shape[:2]
+  # copies the array once, into the image
+  return _frombytes("RGB", (w, h), a.data)
+
+def _luminance(surf):
+  """Return luminance of the RGB image surf as an L image.
+  Computes int(0.299 * r + 0.587 * g + 0.114 * b) in double precision,
+  exactly like the luminance function in the lecture.  (PIL's own
+  convert("L") rounds differently.)"""
+  w, h = surf.size
+  if w == 0 or h == 0:
+    return _Image.new("L", (w, h))
+  if _np is not None:
+    a = _np.frombuffer(_tobytes(surf), dtype=_np.uint8)
+    a = a.reshape((h, w, 3))
+    v = 0.299 * a[:, :, 0] + 0.587 * a[:, :, 1] + 0.114 * a[:, :, 2]
+    return _frombytes("L", (w, h), v.astype(_np.uint8).tostring())
+  lum = {}
+  data = []
+  for p in surf.getdata():
+    v = lum.get(p)
+    if v is None:
+      r, g, b = p
+      v = int(0.299 * r + 0.587 * g + 0.114 * b)
+      lum[p] = v
+    data.append(v)
+  result = _Image.new("L", (w, h))
+  result.putdata(data)
+  return result
+
+def _reduce(surf, fx, fy):
+  """Shrink surf by the integer factors fx and fy.  Each new pixel is
+  the average of an fx x fy block, rounded down.  If the size is not
+  divisible by the factors, the right and bottom rest is ignored."""
+  w, h = surf.size
+  ow, oh = w // fx, h // fy
+  if ow == 0 or oh == 0:
+    return _Image.new("RGB", (ow, oh))
+  if _np is not None:
+    a = _np.frombuffer(_tobytes(surf), dtype=_np.uint8).reshape((h, w, 3))
+    a = a[:oh * fy, :ow * fx].reshape((oh, fy, ow, fx, 3))
+    a = a.sum(axis=3, dtype=_np.int64).sum(axis=1) // (fx * fy)
+    return _frombytes("RGB", (ow, oh), a.astype(_np.uint8).tostring())
+  # add up the fx * fy subsampled images, one band at a time
+  bands = []
+  for band in surf.split():
+    total = None
+    for dy in range(fy):
+      for dx in range(fx):
+        # samples pixel (fx * x + dx, fy * y + dy) for pixel x, y
+        sub = band.transform((ow, oh), _Image.AFFINE,
+                             (fx, 0, dx - 0.5 * fx + 0.5,
+                              0, fy, dy - 0.5 * fy + 0.5), _Image.NEAREST)
+        if total is None:
+          total = sub.convert("I")
+        else:
+          total = _ImageMath.eval("a + b", a=total, b=sub)
+    bands.append(_ImageMath.eval("convert(a / n, 'L')", a=total, n=fx * fy))
+  return _Image.merge("RGB", bands)
 
 # --------------------------------------------------------------------
 
@@ -27,16 +153,64 @@ class Picture(object):
   def __init__(self, surf):
     """Create a Picture from an Image object."""
     self._title = ""
+    self._shared = None
     self._reset(surf)
 
   def _reset(self, surf):
+    if self._shared is not None:
+      self._shared.discard(self)
+      self._shared = None
     self._surf = surf
     self._pixels = surf.load()
+    # set writes through _wpixels, which is _pixels unless the 
+    # surface is shared with a copy
+    self._wpixels = self._pixels
+
+  def _touch(self):
+    """Prepare for modifying the surface: if it is shared with a copy,
+    make a private copy first."""
+    if self._shared is not None:
+      self._shared.discard(self)
+      if len(self._shared) > 0:
+        self._shared = None
+        self._reset(self._surf.copy())
+      else:
+        self._shared = None
+        self._wpixels = self._pixels
+
+  def _modify(self):
+    """Return the surface to be modified.  Call _modified when done."""
+    self._touch()
+    return self._surf
+
+  def _modified(self, surf):
+    if surf is not self._surf:
+      self._reset(surf)
 
   def size(self):
     """Return size of the image as a tuple (width, height)."""
     return self._surf.size
 
+  def copy(self):
+    """Return a copy of the image.
+    The copy shares the pixel data with this image until one of
+    them is modified, so copying is cheap."""
+    p = Picture(self._surf)
+    p.set_title(self._title)
+    if self._shared is None:
+      self._shared = _weakref.WeakSet([self])
+      self._wpixels = _CopyOnWrite(self)
+    self._shared.add(p)
+    p._shared = self._shared
+    p._wpixels = _CopyOnWrite(p)
+    return p
+
+  def view(self, x1, y1, x2, y2):
+    """Return the rectangle x1 <= x < x2, y1 <= y < y2 of this image
+    as a picture.  This does not copy any pixels: changing the view
+    changes this image, and changing this image changes the view."""
+    return _PictureView(self, self._box(x1, y1, x2, y2))
+
   def show1(self):
     """Display the image."""
     self._surf.show()
@@ -48,7 +222,7 @@ class Picture(object):
 
   def set_pixels(self, color = (0,0,0)):
     """Set all pixels of the image to the given color."""
-    surf = _Image.new("RGB", self._surf.size, color)
+    surf = _Image.new("RGB", self.size(), color)
     self._reset(surf)
 
   def set_title(self, title):
@@ -65,12 +239,250 @@ class Picture(object):
 
   def set(self, x, y, color):
     """Set pixel at x, y to color."""
-    self._pixels[x, y] = color
+    self._wpixels[x, y] = color
+
+  def _box(self, x1, y1, x2, y2):
+    w, h = self.size()
+    if x2 is None: x2 = w
+    if y2 is None: y2 = h
+    if not (0 <= x1 <= x2 <= w and 0 <= y1 <= y2 <= h):
+      raise ValueError("Invalid region: " + str((x1, y1, x2, y2)))
+    return (x1, y1, x2, y2)
+
+  def get_region(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return list of pixel colors in the rectangle x1 <= x < x2,
+    y1 <= y < y2, row by row."""
+    box = self._box(x1, y1, x2, y2)
+    return list(self._surf.crop(box).getdata())
+
+  def set_region(self, x1, y1, x2, y2, colors):
+    """Set pixels in the rectangle x1 <= x < x2, y1 <= y < y2 
+    to the colors in the list, row by row."""
+    box = self._box(x1, y1, x2, y2)
+    size = (box[2] - box[0], box[3] - box[1])
+    if len(colors) != size[0] * size[1]:
+      raise ValueError("Need " + str(size[0] * size[1]) + " colors, got "
+                       + str(len(colors)))
+    img = _Image.new("RGB", size)
+    img.putdata(colors)
+    surf = self._modify()
+    surf.paste(img, box)
+    self._modified(surf)
+
+  def get_buffer(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return pixels in the rectangle x1 <= x < x2, y1 <= y < y2 as a
+    string of bytes r, g, b, r, g, b, ..., row by row."""
+    box = self._box(x1, y1, x2, y2)
+    return _tobytes(self._surf.crop(box))
+
+  def set_buffer(self, x1, y1, x2, y2, data):
+    """Set pixels in the rectangle x1 <= x < x2, y1 <= y < y2 from a
+    string of bytes r, g, b, r, g, b, ..., row by row."""
+    box = self._box(x1, y1, x2, y2)
+    size = (box[2] - box[0], box[3] - box[1])
+    if len(data) != 3 * size[0] * size[1]:
+      raise ValueError("Need " + str(3 * size[0] * size[1]) + 
+                       " bytes, got " + str(len(data)))
+    surf = self._modify()
+    surf.paste(_frombytes("RGB", size, data), box)
+    self._modified(surf)
+
+  def get_row(self, y):
+    """Return list of pixel colors in row y."""
+    return self.get_region(0, y, None, y + 1)
+
+  def set_row(self, y, colors):
+    """Set pixels in row y to the colors in the list."""
+    self.set_region(0, y, self.size()[0], y + 1, colors)
+
+  def get_column(self, x):
+    """Return list of pixel colors in column x."""
+    return self.get_region(x, 0, x + 1, None)
+
+  def set_column(self, x, colors):
+    """Set pixels in column x to the colors in the list."""
+    self.set_region(x, 0, x + 1, self.size()[1], colors)
+
+  def paste(self, pict, x1, y1, key = None):
+    """Copy the picture pict into this image, with its top left corner 
+    at x1, y1.  If key is given, pixels of pict with color key are not
+    copied.  Parts of pict outside this image are ignored."""
+    src = pict._surf
+    surf = self._modify()
+    if key is None:
+      surf.paste(src, (x1, y1))
+    else:
+      # mask is 255 where at least one band differs from key
+      masks = [band.point([0 if v == k else 255 for v in range(256)])
+               for band, k in zip(src.split(), key)]
+      mask = _ImageChops.lighter(_ImageChops.lighter(masks[0], masks[1]),
+                                 masks[2])
+      surf.paste(src, (x1, y1), mask)
+    self._modified(surf)
+
+  def _region(self, x1, y1, x2, y2):
+    box = self._box(x1, y1, x2, y2)
+    if box == (0, 0) + self.size():
+      return self._surf
+    return self._surf.crop(box)
+
+  def histogram(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return three lists (red, green, blue) of 256 numbers each, 
+    such that red[v] is the number of pixels whose red value is v.
+    Only pixels in the rectangle x1 <= x < x2, y1 <= y < y2 are counted."""
+    h = self._region(x1, y1, x2, y2).histogram()
+    return (h[0:256], h[256:512], h[512:768])
+
+  def luminance_histogram(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return a list of 256 numbers, such that the v-th number is the
+    number of pixels with luminance v (in the rectangle x1 <= x < x2, 
+    y1 <= y < y2).  The luminance of (r, g, b) is 
+    int(0.299 * r + 0.587 * g + 0.114 * b)."""
+    return _luminance(self._region(x1, y1, x2, y2)).histogram()
+
+  def mean(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return the average color (r, g, b) of the pixels in the rectangle
+    x1 <= x < x2, y1 <= y < y2, as floating point numbers."""
+    region = self._region(x1, y1, x2, y2)
+    if region.size[0] * region.size[1] == 0:
+      raise ValueError("Cannot compute mean of an empty region")
+    return tuple(_ImageStat.Stat(region).mean)
+
+  def extrema(self, x1 = 0, y1 = 0, x2 = None, y2 = None):
+    """Return ((rmin, rmax), (gmin, gmax), (bmin, bmax)), the smallest and
+    largest value of each color in the rectangle x1 <= x < x2, 
+    y1 <= y < y2."""
+    region = self._region(x1, y1, x2, y2)
+    if region.size[0] * region.size[1] == 0:
+      raise ValueError("Cannot compute extrema of an empty region")
+    return region.getextrema()
+
+  def fill_rect(self, x1, y1, x2, y2, color):
+    """Set all pixels in the rectangle x1 <= x < x2, y1 <= y < y2 
+    to color.  Parts of the rectangle outside the image are ignored."""
+    w, h = self.size()
+    x1, y1 = max(x1, 0), max(y1, 0)
+    x2, y2 = min(x2, w), min(y2, h)
+    if x1 < x2 and y1 < y2:
+      surf = self._modify()
+      surf.paste(color, (x1, y1, x2, y2))
+      self._modified(surf)
+
+  def draw_hline(self, y, color, x1 = 0, x2 = None):
+    """Set the pixels x1 <= x < x2 in row y to color.
+    Without x1 and x2, the entire row is set."""
+    if x2 is None:
+      x2 = self.size()[0]
+    self.fill_rect(x1, y, x2, y + 1, color)
+
+  def draw_vline(self, x, color, y1 = 0, y2 = None):
+    """Set the pixels y1 <= y < y2 in column x to color.
+    Without y1 and y2, the entire column is set."""
+    if y2 is None:
+      y2 = self.size()[1]
+    self.fill_rect(x, y1, x + 1, y2, color)
+
+  def draw_polyline(self, points, color, width = 1):
+    """Draw line segments connecting the points [(x1, y1), (x2, y2), ...]
+    (including both endpoints) with the given color and width."""
+    surf = self._modify()
+    _ImageDraw.Draw(surf).line([tuple(p) for p in points], 
+                               fill=tuple(color), width=width)
+    self._modified(surf)
+
+  def draw_line(self, x1, y1, x2, y2, color, width = 1):
+    """Draw a line from x1, y1 to x2, y2 (including both endpoints)
+    with the given color and width."""
+    self.draw_polyline([(x1, y1), (x2, y2)], color, width)
+
+  def _derived(self, surf):
+    p = Picture(surf)
+    p.set_title(self._title)
+    return p
+
+  def resize(self, width, height, method = "bilinear"):
+    """Return a new image of size width x height.
+    method is "nearest", "bilinear", or "box".  With "box", each new
+    pixel is the average of the old pixels it covers; when the new size
+    divides the old size, this is computed exactly like scale_down."""
+    w, h = self.size()
+    if width <= 0 or height <= 0:
+      raise ValueError("Invalid image dimensions: " + str(width) + ", " 
+                       + str(height))
+    if method == "box":
+      if w % width == 0 and h % height == 0:
+        return self._derived(_reduce(self._surf, w // width, h // height))
+      filter = _Image.BOX if hasattr(_Image, "BOX") else _Image.ANTIALIAS
+    elif method == "bilinear":
+      filter = _Image.BILINEAR
+    elif method == "nearest":
+      filter = _Image.NEAREST
+    else:
+      raise ValueError("Unknown resize method: " + str(method))
+    return self._derived(self._surf.resize((width, height), filter))
+
+  def scale_down(self, factor):
+    """Return a new image, smaller by the integer factor.  Each new pixel
+    is the average of a factor x factor block, rounded down."""
+    if factor < 1 or factor != int(factor):
+      raise ValueError("Invalid scale factor: " + str(factor))
+    factor = int(factor)
+    return self._derived(_reduce(self._surf, factor, factor))
+
+  def rotate(self, angle = 90):
+    """Return a new image, rotated counter-clockwise by angle, which must
+    be 90, 180, or 270 degrees."""
+    methods = { 90: _Image.ROTATE_90, 180: _Image.ROTATE_180,
+                270: _Image.ROTATE_270 }
+    if angle % 360 == 0:
+      return self._derived(self._surf.copy())
+    if angle % 360 not in methods:
+      raise ValueError("Can only rotate by multiples of 90 degrees")
+    return self._derived(self._surf.transpose(methods[angle % 360]))
+
+  def flip(self, vertical = False):
+    """Return a new image, mirrored left-to-right, or top-to-bottom if
+    vertical is True."""
+    if vertical:
+      return self._derived(self._surf.transpose(_Image.FLIP_TOP_BOTTOM))
+    return self._derived(self._surf.transpose(_Image.FLIP_LEFT_RIGHT))
+
+  def to_array(self):
+    """Return a NumPy array of shape (height, width, 3) containing
+    a copy of the pixels.  Note that the array is indexed as [y, x]."""
+    _need_numpy()
+    w, h = self.size()
+    if w == 0 or h == 0:
+      return _np.zeros((h, w, 3), dtype=_np.uint8)
+    # numpy copies the pixels straight from the image
+    return _np.array(self._surf, dtype=_np.uint8)
+
+  def set_array(self, a):
+    """Set all pixels from a NumPy array of shape (height, width, 3)
+    or (height, width).  Values are clipped to the range 0 .. 255."""
+    img = _array_to_image(a)
+    if img.size != self.size():
+      raise ValueError("Array size " + str(img.size) + 
+                       " does not match image size " + str(self.size()))
+    self._reset(img)
+
+  @_contextlib.contextmanager
+  def array_view(self):
+    """Use in a with statement to modify the image as a NumPy array:
+
+      with img.array_view() as a:
+        a[:, :, 0] = 255 - a[:, :, 0]
+
+    The pixels are written back to the image at the end of the block."""
+    a = self.to_array()
+    yield a
+    self.set_array(a)
 
   def save_as(self, filename = None):
     """Save image as filename.
     If no filename is given, open file-chooser."""
     if not filename:
+      _load_gui()
       filename = _easygui.filesavebox("Save image as", _sys.argv[0], 
                                       "unnamed.png",
                                       [ [ "*.jpg", "*.png", "*.bmp",
@@ -79,6 +491,104 @@ class Picture(object):
         raise RuntimeError("No file name provided for saving.")
     self._surf.save(filename)
 
+  def write_ppm(self, f, gray = False):
+    """Write the image to the file object f as a binary PPM file,
+    or as a binary PGM file of its luminance if gray is True.
+    The image is written in strips of rows, so f can be a pipe."""
+    w, h = self.size()
+    f.write("%s\n%d %d\n255\n" % ("P5" if gray else "P6", w, h))
+    self._write_strips(f, gray)
+
+  def write_raw(self, f):
+    """Write the pixels to the file object f as raw RGB data, 
+    row by row, without any header."""
+    self._write_strips(f, False)
+
+  def _write_strips(self, f, gray):
+    surf = self._surf
+    w, h = surf.size
+    if w == 0:
+      return
+    step = _strip_height(w)
+    for y in range(0, h, step):
+      strip = surf.crop((0, y, w, min(y + step, h)))
+      if gray:
+        strip = _luminance(strip)
+      f.write(_tobytes(strip))
+
+# --------------------------------------------------------------------
+
+class _CopyOnWrite(object):
+  """Stands in for the pixel access object of a picture whose surface
+  is shared: the first write makes a private copy of the surface."""
+
+  def __init__(self, pict):
+    self._pict = _weakref.ref(pict)
+
+  def __setitem__(self, xy, color):
+    pict = self._pict()
+    pict._touch()
+    pict._pixels[xy] = color
+
+class _PictureView(Picture):
+  """A rectangle of another picture, returned by Picture.view."""
+
+  def __init__(self, parent, box):
+    if isinstance(parent, _PictureView):
+      x0, y0 = parent._offset
+      box = (box[0] + x0, box[1] + y0, box[2] + x0, box[3] + y0)
+      parent = parent._parent
+    self._title = parent.title()
+    self._parent = parent
+    self._offset = box[:2]
+    self._rect = box
+    self._vsize = (box[2] - box[0], box[3] - box[1])
+
+  @property
+  def _surf(self):
+    return self._parent._surf.crop(self._rect)
+
+  def _reset(self, surf):
+    if surf.size != self._vsize:
+      raise ValueError("Size " + str(surf.size) + 
+                       " does not match view size " + str(self._vsize))
+    psurf = self._parent._modify()
+    psurf.paste(surf, self._offset)
+    self._parent._modified(psurf)
+
+  def _touch(self):
+    self._parent._touch()
+
+  def _modify(self):
+    return self._surf
+
+  def _modified(self, surf):
+    self._reset(surf)
+
+  def size(self):
+    """Return size of the image as a tuple (width, height)."""
+    return self._vsize
+
+  def get(self, x, y):
+    """Return pixel at x, y."""
+    w, h = self._vsize
+    if not (0 <= x < w and 0 <= y < h):
+      raise IndexError("image index out of range")
+    return self._parent._pixels[x + self._offset[0], y + self._offset[1]]
+
+  def set(self, x, y, color):
+    """Set pixel at x, y to color."""
+    w, h = self._vsize
+    if not (0 <= x < w and 0 <= y < h):
+      raise IndexError("image index out of range")
+    self._parent._wpixels[x + self._offset[0], y + self._offset[1]] = color
+
+  def copy(self):
+    """Return a copy of the image."""
+    p = Picture(self._surf)
+    p.set_title(self._title)
+    return p
+
 # --------------------------------------------------------------------
 
 def create_picture(width, height, color = (0,0,0)):
@@ -89,30 +599,509 @@ def create_picture(width, height, color = (0,0,0)):
   p = Picture(_Image.new("RGB", (width, height), color))
   return p
 
+def from_array(a):
+  """Create an image from a NumPy array of shape (height, width, 3)
+  or (height, width)."""
+  return Picture(_array_to_image(a))
+
+def concat(pictures, vertical = False, color = (255, 255, 255)):
+  """Create an image by putting the pictures next to each other from
+  left to right (or from top to bottom if vertical is True).  The rest
+  of the image is filled with color."""
+  sizes = [p.size() for p in pictures]
+  if vertical:
+    w = max([s[0] for s in sizes] + [0])
+    h = sum([s[1] for s in sizes])
+  else:
+    w = sum([s[0] for s in sizes])
+    h = max([s[1] for s in sizes] + [0])
+  surf = _Image.new("RGB", (w, h), color)
+  pos = 0
+  for p, size in zip(pictures, sizes):
+    if vertical:
+      surf.paste(p._surf, (0, pos))
+      pos += size[1]
+    else:
+      surf.paste(p._surf, (pos, 0))
+      pos += size[0]
+  return Picture(surf)
+
 def load_picture(filename = None):
   """Create an image by loading file filename.
   Opens file-chooser if no file name given."""
   if not filename:
+    _load_gui()
     filename = _easygui.fileopenbox("Select an image", 
                                     _sys.argv[0], '*', 
                                     [ [ "*.jpg", "*.png", "*.bmp", "*.gif",
                                         "Image files" ] ])
     if not filename: 
       raise RuntimeError("No image file selected.")
+  t = _timer()
   img = _Image.open(filename)
   if img.mode != "RGB":
     img = img.convert("RGB")
   p = Picture(img)
   p.set_title(filename)
+  if _profile is not None and _profile.stop is None:
+    _profile.add("load", p, _sys._getframe(1), _timer() - t)
   return p
 
+def _read_exactly(f, n):
+  data = f.read(n)
+  while 0 < len(data) < n:  # pipes can return less than requested
+    more = f.read(n - len(data))
+    if not more:
+      break
+    data += more
+  return data
+
+def _read_ppm_header(f):
+  """Read the header of a binary PPM or PGM image from f.
+  Returns (magic, width, height), or None at the end of the file."""
+  c = f.read(1)
+  while c and c.isspace():
+    c = f.read(1)
+  if not c:
+    return None
+  tokens = []
+  token = ""
+  while len(tokens) < 4:
+    if not c:
+      raise ValueError("Truncated PPM header")
+    if c == "#":
+      while c and c not in "\r\n":
+        c = f.read(1)
+      continue
+    if c.isspace():
+      if token:
+        tokens.append(token)
+        token = ""
+    else:
+      token += c
+    if len(tokens) < 4:
+      c = f.read(1)
+  if tokens[0] not in ("P5", "P6"):
+    raise ValueError("Not a binary PPM or PGM image: " + tokens[0])
+  try:
+    w, h, maxval = [int(t) for t in tokens[1:]]
+  except ValueError:
+    raise ValueError("Invalid PPM header: " + " ".join(tokens))
+  if maxval != 255:
+    raise ValueError("Only PPM images with 8 bits per channel are supported")
+  return (tokens[0], w, h)
+
+def _read_surf(f, mode, w, h):
+  """Read the pixels of a w x h image from f.
+  Returns None if f is at its end."""
+  n = len(mode) * w * h
+  if n == 0:
+    return _Image.new(mode, (w, h))
+  data = _read_exactly(f, n)
+  if not data:
+    return None
+  if len(data) < n:
+    raise ValueError("Image data is truncated")
+  return _frombytes(mode, (w, h), data)
+
+def read_ppm(f):
+  """Read a binary PPM or PGM image from the file object f.
+  Returns None if f is at its end.  The file can contain several
+  images one after the other, so this can read images from a pipe."""
+  header = _read_ppm_header(f)
+  if header is None:
+    return None
+  magic, w, h = header
+  surf = _read_surf(f, "L" if magic == "P5" else "RGB", w, h)
+  if surf is None:
+    raise ValueError("Image data is missing")
+  if surf.mode != "RGB":
+    surf = surf.convert("RGB")
+  return Picture(surf)
+
+def read_raw(f, width, height):
+  """Read an image of size width x height from the file object f,
+  stored as raw RGB data row by row (as written by write_raw).
+  Returns None if f is at its end."""
+  surf = _read_surf(f, "RGB", width, height)
+  if surf is None:
+    return None
+  return Picture(surf)
+
 def choose_color():
+  _load_gui()
   color = _tkColorChooser.askcolor()
   new_color = (color[0][0], color[0][1], color[0][2])
   return new_color
 
 # --------------------------------------------------------------------
 
+class TiledPicture(object):
+  """A digital image that is too large to keep in memory.
+
+  The pixels are stored in a memory-mapped file.  Tiles of the image
+  are loaded when needed, and only the cache_size most recently used
+  tiles are kept in memory.  A TiledPicture supports the same basic
+  methods as a Picture: size, get, set, set_pixels, title, set_title,
+  save_as, write_ppm, write_raw, and show."""
+
+  def __init__(self, width, height, color = (0,0,0), 
+               tile_size = 256, cache_size = 64):
+    """Create a TiledPicture of size width x height filled with color."""
+    if width <= 0 or height <= 0:
+      raise ValueError("Invalid image dimensions: " + str(width) + ", " 
+                       + str(height))
+    self._title = ""
+    self._size = (width, height)
+    self._tile_size = tile_size
+    self._cache_size = max(cache_size, 1)
+    self._file = _tempfile.TemporaryFile()
+    self._file.truncate(3 * width * height)
+    self._map = _mmap.mmap(self._file.fileno(), 3 * width * height)
+    self._tiles = _OrderedDict()
+    self._last = None
+    self.set_pixels(color)
+
+  def size(self):
+    """Return size of the image as a tuple (width, height)."""
+    return self._size
+
+  def set_title(self, title):
+    """Set title of image."""
+    self._title = title
+
+  def title(self):
+    """Return title of image."""
+    return self._title
+
+  def _write_rows(self, y, rows):
+    """Write raw RGB data for full rows, starting at row y."""
+    offset = 3 * self._size[0] * y
+    self._map[offset:offset + len(rows)] = rows
+
+  def set_pixels(self, color = (0,0,0)):
+    """Set all pixels of the image to the given color."""
+    self._tiles.clear()
+    self._last = None
+    w, h = self._size
+    row = _tobytes(_Image.new("RGB", (w, 1), color))
+    for y in range(h):
+      self._write_rows(y, row)
+
+  def _tile_box(self, key):
+    ts = self._tile_size
+    x0, y0 = key[0] * ts, key[1] * ts
+    return (x0, y0, min(x0 + ts, self._size[0]), min(y0 + ts, self._size[1]))
+
+  def _load_tile(self, key):
+    x0, y0, x1, y1 = self._tile_box(key)
+    w = self._size[0]
+    data = []
+    for y in range(y0, y1):
+      offset = 3 * (y * w + x0)
+      data.append(self._map[offset:offset + 3 * (x1 - x0)])
+    img = _frombytes("RGB", (x1 - x0, y1 - y0), "".join(data))
+    return [img, img.load(), False]
+
+  def _store_tile(self, key, tile):
+    x0, y0, x1, y1 = self._tile_box(key)
+    w = self._size[0]
+    data = _tobytes(tile[0])
+    rw = 3 * (x1 - x0)
+    for y in range(y0, y1):
+      offset = 3 * (y * w + x0)
+      start = (y - y0) * rw
+      self._map[offset:offset + rw] = data[start:start + rw]
+    tile[2] = False
+
+  def _tile(self, x, y):
+    w, h = self._size
+    if not (0 <= x < w and 0 <= y < h):
+      raise IndexError("image index out of range")
+    ts = self._tile_size
+    key = (x // ts, y // ts)
+    tile = self._tiles.pop(key, None)
+    if tile is None:
+      tile = self._load_tile(key)
+      if len(self._tiles) >= self._cache_size:
+        old_key, old_tile = self._tiles.popitem(last=False)
+        if old_tile[2]:
+          self._store_tile(old_key, old_tile)
+    self._tiles[key] = tile
+    self._last = (key, tile)
+    return tile
+
+  def get(self, x, y):
+    """Return pixel at x, y."""
+    ts = self._tile_size
+    last = self._last
+    if last is None or last[0] != (x // ts, y // ts):
+      tile = self._tile(x, y)
+    else:
+      tile = last[1]
+    return tile[1][x % ts, y % ts]
+
+  def set(self, x, y, color):
+    """Set pixel at x, y to color."""
+    ts = self._tile_size
+    last = self._last
+    if last is None or last[0] != (x // ts, y // ts):
+      tile = self._tile(x, y)
+    else:
+      tile = last[1]
+    tile[1][x % ts, y % ts] = color
+    tile[2] = True
+
+  def flush(self):
+    """Write all modified tiles to the file."""
+    for key, tile in self._tiles.items():
+      if tile[2]:
+        self._store_tile(key, tile)
+    self._map.flush()
+
+  def to_picture(self):
+    """Return a Picture with the same pixels.  
+    Note that this needs enough memory for the entire image."""
+    self.flush()
+    p = Picture(_frombytes("RGB", self._size, self._map[:]))
+    p.set_title(self._title)
+    return p
+
+  def show(self):
+    """Display the image and wait until user closes the image window."""
+    self.to_picture().show()
+
+  def save_as(self, filename = None):
+    """Save image as filename.
+    If no filename is given, open file-chooser.
+    PPM files are written directly from the file on disk, 
+    other formats need enough memory for the entire image."""
+    if filename and filename.lower().endswith(".ppm"):
+      f = open(filename, "wb")
+      self.write_ppm(f)
+      f.close()
+    else:
+      self.to_picture().save_as(filename)
+
+  def write_ppm(self, f, gray = False):
+    """Write the image to the file object f as a binary PPM file,
+    or as a binary PGM file of its luminance if gray is True."""
+    f.write("%s\n%d %d\n255\n" % (("P5" if gray else "P6",) + self._size))
+    self._write_strips(f, gray)
+
+  def write_raw(self, f):
+    """Write the pixels to the file object f as raw RGB data, 
+    row by row, without any header."""
+    self._write_strips(f, False)
+
+  def _write_strips(self, f, gray):
+    self.flush()
+    w, h = self._size
+    step = _strip_height(w)
+    for y in range(0, h, step):
+      rows = self._map[3 * w * y:3 * w * min(y + step, h)]
+      if gray:
+        strip = _frombytes("RGB", (w, len(rows) // (3 * w)), rows)
+        rows = _tobytes(_luminance(strip))
+      f.write(rows)
+
+def create_tiled_picture(width, height, color = (0,0,0), 
+                         tile_size = 256, cache_size = 64):
+  """Create a tiled image of size width x height, and fill with color."""
+  return TiledPicture(width, height, color, tile_size, cache_size)
+
+def _read_tiled_ppm(f, tile_size, cache_size):
+  """Read a binary PPM or PGM image from f into a new TiledPicture,
+  strip by strip."""
+  header = _read_ppm_header(f)
+  if header is None:
+    raise ValueError("Empty PPM file")
+  magic, w, h = header
+  mode = "L" if magic == "P5" else "RGB"
+  p = TiledPicture(w, h, (0,0,0), tile_size, cache_size)
+  step = _strip_height(w)
+  for y in range(0, h, step):
+    strip = _read_surf(f, mode, w, min(step, h - y))
+    if strip is None:
+      raise ValueError("Image data is truncated")
+    if mode != "RGB":
+      strip = strip.convert("RGB")
+    p._write_rows(y, _tobytes(strip))
+  return p
+
+def load_tiled_picture(filename, tile_size = 256, cache_size = 64):
+  """Create a tiled image by loading file filename.
+  Binary PPM and PGM files are read strip by strip, so they can be
+  larger than the available memory.  Other formats are decoded by PIL,
+  which needs enough memory for the entire image; the decoded image is
+  then copied strip by strip to disk and released."""
+  t = _timer()
+  f = open(filename, "rb")
+  try:
+    if f.read(2) in ("P5", "P6"):
+      f.seek(0)
+      p = _read_tiled_ppm(f, tile_size, cache_size)
+    else:
+      p = None
+  finally:
+    f.close()
+  if p is None:
+    img = _Image.open(filename)
+    w, h = img.size
+    p = TiledPicture(w, h, (0,0,0), tile_size, cache_size)
+    step = _strip_height(w)
+    for y in range(0, h, step):
+      strip = img.crop((0, y, w, min(y + step, h)))
+      if strip.mode != "RGB":
+        strip = strip.convert("RGB")
+      p._write_rows(y, _tobytes(strip))
+    del img
+  p.set_title(filename)
+  if _profile is not None and _profile.stop is None:
+    _profile.add("load", p, _sys._getframe(1), _timer() - t)
+  return p
+
+# --------------------------------------------------------------------
+
+##
+## Profiling
+##
+
+# The profile being recorded, or None.  When profiling is off, get and
+# set are the plain methods, so there is no overhead at all.
+_profile = None
+_patched = []
+
+class _Profile(object):
+  """Counts and times calls of get, set, load, and save."""
+
+  def __init__(self):
+    self.start = _timer()
+    self.stop = None
+    self.totals = {}     # operation -> [calls, seconds]
+    self.sites = {}      # (file, line, function, operation) -> [calls, seconds]
+    self.records = []    # one dictionary per picture
+    self.pictures = _weakref.WeakKeyDictionary()  # picture -> record
+    self.depth = 0       # nesting of profiled calls
+
+  def add(self, op, pict, frame, seconds):
+    code = frame.f_code
+    key = (code.co_filename, frame.f_lineno, code.co_name, op)
+    for table, k in ((self.totals, op), (self.sites, key)):
+      entry = table.get(k)
+      if entry is None:
+        table[k] = [1, seconds]
+      else:
+        entry[0] += 1
+        entry[1] += seconds
+    rec = self.pictures.get(pict)
+    if rec is None:
+      rec = { "title": pict.title(), "type": type(pict).__name__,
+              "size": pict.size(), "seconds": 0.0 }
+      self.records.append(rec)
+      self.pictures[pict] = rec
+    rec[op] = rec.get(op, 0) + 1
+    rec["seconds"] += seconds
+
+def _profiled(op, func):
+  def wrapper(self, *args, **kwargs):
+    prof = _profile
+    if prof.depth > 0:
+      # called from another profiled call, like TiledPicture.save_as
+      # calling Picture.save_as: only the outer call is recorded
+      return func(self, *args, **kwargs)
+    prof.depth += 1
+    t = _timer()
+    try:
+      return func(self, *args, **kwargs)
+    finally:
+      prof.depth -= 1
+      prof.add(op, self, _sys._getframe(1), _timer() - t)
+  wrapper.__name__ = func.__name__
+  wrapper.__doc__ = func.__doc__
+  return wrapper
+
+def start_profiling():
+  """Start counting and timing the calls of get, set, load_picture, and
+  save_as, for each picture and for each line of code calling them.
+  Any previous profile is discarded."""
+  global _profile
+  stop_profiling()
+  _profile = _Profile()
+  for cls, op, name in ((Picture, "get", "get"), (Picture, "set", "set"),
+                        (Picture, "save", "save_as"),
+                        (_PictureView, "get", "get"),
+                        (_PictureView, "set", "set"),
+                        (TiledPicture, "get", "get"),
+                        (TiledPicture, "set", "set"),
+                        (TiledPicture, "save", "save_as")):
+    func = cls.__dict__[name]
+    _patched.append((cls, name, func))
+    setattr(cls, name, _profiled(op, func))
+
+def stop_profiling():
+  """Stop profiling.  The profile is kept for profile_stats and
+  profile_report."""
+  while _patched:
+    cls, name, func = _patched.pop()
+    setattr(cls, name, func)
+  if _profile is not None and _profile.stop is None:
+    _profile.stop = _timer()
+
+def profile_stats():
+  """Return the current profile as a dictionary, or None if profiling
+  was never started.  Times are in seconds and include the overhead
+  of measuring them."""
+  if _profile is None:
+    return None
+  total = (_profile.stop or _timer()) - _profile.start
+  measured = sum([s for n, s in _profile.totals.values()])
+  pixel = sum([_profile.totals.get(op, [0, 0.0])[1] for op in ("get", "set")])
+  sites = [ { "file": f, "line": line, "function": func, "operation": op,
+              "calls": n, "seconds": s }
+            for (f, line, func, op), (n, s) in _profile.sites.items() ]
+  sites.sort(key = lambda d: -d["calls"])
+  pictures = sorted(_profile.records, key = lambda d: -d["seconds"])
+  return { "seconds": total,
+           "pixel_seconds": pixel,
+           "other_seconds": total - measured,
+           "operations": dict([(op, { "calls": n, "seconds": s })
+                               for op, (n, s) in _profile.totals.items()]),
+           "sites": sites,
+           "pictures": [dict(rec) for rec in pictures] }
+
+def profile_report(out = _sys.stdout, limit = 10):
+  """Write a summary of the profile to out, with the limit busiest
+  call sites and pictures."""
+  st = profile_stats()
+  if st is None:
+    out.write("Profiling was not started.\n")
+    return
+  total = st["seconds"]
+  pct = lambda s: 100.0 * s / total if total > 0 else 0.0
+  io = total - st["pixel_seconds"] - st["other_seconds"]
+  out.write("%.3f seconds: %.3f in get/set (%.0f%%), %.3f in load/save, "
+            "%.3f in other code\n" %
+            (total, st["pixel_seconds"], pct(st["pixel_seconds"]), io,
+             st["other_seconds"]))
+  out.write("\n%-10s %10s %10s\n" % ("operation", "calls", "seconds"))
+  for op in ("get", "set", "load", "save"):
+    if op in st["operations"]:
+      d = st["operations"][op]
+      out.write("%-10s %10d %10.3f\n" % (op, d["calls"], d["seconds"]))
+  out.write("\n%10s %10s  %-6s %s\n" % ("calls", "seconds", "op", "call site"))
+  for d in st["sites"][:limit]:
+    out.write("%10d %10.3f  %-6s %s:%d (%s)\n" %
+              (d["calls"], d["seconds"], d["operation"], d["file"],
+               d["line"], d["function"]))
+  out.write("\n%10s %10s %10s  %s\n" % ("get", "set", "seconds", "picture"))
+  for d in st["pictures"][:limit]:
+    out.write("%10d %10d %10.3f  %s %dx%d %s\n" %
+              (d.get("get", 0), d.get("set", 0), d["seconds"], d["type"],
+               d["size"][0], d["size"][1], d["title"]))
+
+# --------------------------------------------------------------------
+
 ##
 ## Color Constants
 ##
@@ -265,10 +1254,14 @@ class Color(object):
 
 class PictureTool:
 
+  tile_size = 256   # size of the pieces in which the image is drawn
+  cache_size = 256  # number of pieces kept in memory
+
   def __init__(self, pict):
     self.pict = pict
     
   def run_tool(self):
+    _load_gui()
     self.root = _Tk.Tk()
     
     self.top = _Tk.Menu(self.root, bd=2)
@@ -300,15 +1293,19 @@ class PictureTool:
     
     self.root.im = self.pict._surf
     self.root.zoomMult = 1.0
-    
-    self.root.photo1 = _ImageTk.PhotoImage(image=self.root.im)
+    # zoom pyramid: levels[k] is the image reduced by a factor 2**k
+    self.levels = { 0: self.root.im }
+    # canvas items of the pieces currently shown, by (column, row)
+    self.tiles = {}
+    # recently used pieces, by (zoom, column, row)
+    self.photos = _OrderedDict()
     
     self.root.title(self.pict.title())
     
     # Canvas for the Image, with scroll bars
     
-    self.canvas1 = _Tk.Canvas(self.frame1, width=self.root.photo1.width() -
-                              1, height=self.root.photo1.height() - 1,
+    (wide, high) = self.root.im.size
+    self.canvas1 = _Tk.Canvas(self.frame1, width=wide - 1, height=high - 1,
                               cursor="crosshair", borderwidth=0)
     self.root.vbar = _Tk.Scrollbar(self.frame1)
     self.root.hbar = _Tk.Scrollbar(self.frame1, orient='horizontal')
@@ -319,13 +1316,14 @@ class PictureTool:
                       fill=_Tk.BOTH, expand=_Tk.YES)
 
     # call on scroll move
-    self.root.vbar.config(command=self.canvas1.yview)  
-    self.root.hbar.config(command=self.canvas1.xview)
+    self.root.vbar.config(command=self.yview)  
+    self.root.hbar.config(command=self.xview)
     # call on canvas move
     self.canvas1.config(yscrollcommand=self.root.vbar.set)  
     self.canvas1.config(xscrollcommand=self.root.hbar.set)
-    self.draw_image(self.root.im)
+    self.draw_image()
     self.canvas1.bind('<Button-1>', self.canvClick)
+    self.canvas1.bind('<Configure>', self.update_tiles)
     
     self.v = _Tk.StringVar()
     self.v.set("R:      G:      B:     ")
@@ -347,27 +1345,101 @@ class PictureTool:
   def zoomf(self, factor):
     # zoom in or out
     self.root.zoomMult = factor
+    self.draw_image()
+
+  def xview(self, *args):
+    self.canvas1.xview(*args)
+    self.update_tiles()
+
+  def yview(self, *args):
+    self.canvas1.yview(*args)
+    self.update_tiles()
+
+  def zoomed_size(self):
     (wide, high) = self.root.im.size
-    new = self.root.im.resize((int(wide * factor), int(high * factor)))
-    self.draw_image(new)
+    factor = self.root.zoomMult
+    return (max(1, int(wide * factor)), max(1, int(high * factor)))
 
-  def draw_image(self, imgpil):
-    self.root.photo1 = _ImageTk.PhotoImage(image=imgpil)  # not file=imgpath
+  def level(self, k):
+    # the image reduced by a factor 2**k, computed only once
+    if k not in self.levels:
+      img = self.level(k - 1)
+      (wide, high) = img.size
+      self.levels[k] = img.resize((max(1, wide // 2), max(1, high // 2)),
+                                  _Image.BILINEAR)
+    return self.levels[k]
+
+  def tile_photo(self, tx, ty):
+    # return PhotoImage for the piece in column tx, row ty
+    factor = self.root.zoomMult
+    key = (factor, tx, ty)
+    photo = self.photos.pop(key, None)
+    if photo is None:
+      # use the smallest pyramid level that is still large enough
+      k = 0
+      while factor * 2 ** (k + 1) <= 1.0:
+        k += 1
+      img = self.level(k)
+      (wide, high) = self.root.im.size
+      sx = img.size[0] / (factor * wide)
+      sy = img.size[1] / (factor * high)
+      (imgwide, imghigh) = self.zoomed_size()
+      x0, y0 = tx * self.tile_size, ty * self.tile_size
+      x1 = min(x0 + self.tile_size, imgwide)
+      y1 = min(y0 + self.tile_size, imghigh)
+      if factor >= 1.0:
+        method = _Image.NEAREST
+      else:
+        method = _Image.BILINEAR
+      tile = img.transform((x1 - x0, y1 - y0), _Image.EXTENT,
+                           (x0 * sx, y0 * sy, x1 * sx, y1 * sy), method)
+      photo = _ImageTk.PhotoImage(image=tile)
+      if len(self.photos) >= self.cache_size:
+        self.photos.popitem(last=False)
+    self.photos[key] = photo
+    return photo
+
+  def update_tiles(self, event=None):
+    # draw the pieces of the image that are visible, remove the others
+    T = self.tile_size
+    (imgwide, imghigh) = self.zoomed_size()
+    viewwide = self.canvas1.winfo_width()
+    viewhigh = self.canvas1.winfo_height()
+    if viewwide <= 1 or viewhigh <= 1:  # not yet on the screen
+      viewwide = int(self.canvas1.cget('width'))
+      viewhigh = int(self.canvas1.cget('height'))
+    x0 = max(0, int(self.canvas1.canvasx(0)))
+    y0 = max(0, int(self.canvas1.canvasy(0)))
+    x1 = min(x0 + viewwide, imgwide)
+    y1 = min(y0 + viewhigh, imghigh)
+    visible = set()
+    for ty in range(y0 // T, (y1 - 1) // T + 1):
+      for tx in range(x0 // T, (x1 - 1) // T + 1):
+        visible.add((tx, ty))
+    for key in list(self.tiles):
+      if key not in visible:
+        self.canvas1.delete(self.tiles.pop(key))
+    for (tx, ty) in visible:
+      if (tx, ty) not in self.tiles:
+        photo = self.tile_photo(tx, ty)
+        self.tiles[tx, ty] = self.canvas1.create_image(tx * T, ty * T, 
+                                                       image=photo,
+                                                       anchor=_Tk.NW)
+
+  def draw_image(self):
     (scrwide, scrhigh) = self.root.maxsize()  # wm screen size x,y
     scrhigh -= 200  # leave room for top display/button at max photo size
-    imgwide = self.root.photo1.width()  # size in pixels
-    imghigh = self.root.photo1.height()  # same as imgpil.size
+    (imgwide, imghigh) = self.zoomed_size()  # size in pixels
     
     fullsize = (0, 0, imgwide, imghigh)  # scrollable
     viewwide = min(imgwide, scrwide)  # viewable
     viewhigh = min(imghigh, scrhigh)
     
     self.canvas1.delete('all')  # clear prior photo
+    self.tiles = {}
     self.canvas1.config(height=viewhigh, width=viewwide)  # viewable window size
     self.canvas1.config(scrollregion=fullsize)  # scrollable area size
-    
-    self.root.img = self.canvas1.create_image(0, 0, image=self.root.photo1,
-                                              anchor=_Tk.NW)
+    self.update_tiles()
     
     if imgwide <= scrwide and imghigh <= scrhigh:  # too big for display?
       self.root.state('normal')  # no: win size per img
@@ -423,6 +1495,7 @@ def picture_tool(filename = None):
   If no filename is given, a file-chooser opens."""
 
   if not filename:
+    _load_gui()
     filename = _easygui.fileopenbox("Select an image", 
                                     _sys.argv[0], '*', 
                                     [ [ "*.jpg", "*.png", "*.bmp", "*.gif",
@@ -0,0 +1,178 @@
+#
+# cs1media_batch.py
+#
+# Apply a sequence of cs1media filters to many image files.
+#
+# Example:
+#
+#   python cs1media_batch.py -o out -f bw -f "twolevels(128)" -f mirror \
+#          "photos/*.jpg"
+#
+# Each -f option adds a filter from cs1media_filters (or the Picture
+# methods scale_down, resize, and flip), written like a Python function
+# call without the image argument.  All results are written to one
+# directory, so the input files must have different names.  The files
+# are processed in parallel by a pool of worker processes.  Every worker
+# holds only one image at a time, so memory use is bounded by the number
+# of workers.
+# At the end, the time spent in each stage is reported.
+#
+
+import ast as _ast
+import glob as _glob
+import multiprocessing as _mp
+import optparse as _optparse
+import os as _os
+import re as _re
+import sys as _sys
+import time as _time
+
+import cs1media as _media
+import cs1media_filters as _filters
+
+# --------------------------------------------------------------------
+
+_filter_names = [ "make_lighter", "make_redder", "negative", "bw",
+                  "twolevels", "sepia", "gradient", "mirror", "reflect",
+                  "rotate", "chroma", "blur", "blur_rect", "posterize",
+                  "edge_detect", "sobel", "autocrop" ]
+
+_method_names = [ "scale_down", "resize", "flip" ]
+
+def parse_stage(text):
+  """Parse a stage like "twolevels(128)" into ("twolevels", (128,))."""
+  m = _re.match(r"^\s*(\w+)\s*(?:\((.*)\))?\s*$", text)
+  if not m:
+    raise ValueError("Cannot parse filter: " + text)
+  name, args = m.group(1), m.group(2)
+  if name not in _filter_names and name not in _method_names:
+    raise ValueError("Unknown filter: " + name)
+  if args and args.strip():
+    args = _ast.literal_eval("(" + args + ",)")
+  else:
+    args = ()
+  return (name, args)
+
+def apply_stage(img, stage):
+  """Apply one parsed stage to img and return the resulting picture."""
+  name, args = stage
+  if name in _method_names:
+    return getattr(img, name)(*args)
+  result = getattr(_filters, name)(img, *args)
+  if result is None:
+    if name == "autocrop":
+      raise ValueError("autocrop: the whole image is border")
+    return img
+  return result
+
+# --------------------------------------------------------------------
+
+def _process(task):
+  """Run in a worker: load, filter, and save one file.
+  Returns (filename, error, list of (stage, seconds), pixels)."""
+  filename, outname, stages = task
+  times = []
+  try:
+    t = _time.time()
+    img = _media.load_picture(filename)
+    times.append(("load", _time.time() - t))
+    w, h = img.size()
+    for stage in stages:
+      t = _time.time()
+      img = apply_stage(img, stage)
+      times.append((stage[0], _time.time() - t))
+    t = _time.time()
+    img.save_as(outname)
+    times.append(("save", _time.time() - t))
+  except Exception as e:
+    return (filename, str(e), times, 0)
+  return (filename, None, times, w * h)
+
+def run(files, outdir, stages, processes = None, extension = None,
+        out = _sys.stdout):
+  """Process all files and write a throughput report to out.
+  Returns the number of files that failed.  Raises ValueError if two
+  files would be written to the same output file."""
+  tasks = []
+  sources = {}
+  for filename in files:
+    base = _os.path.basename(filename)
+    if extension:
+      base = _os.path.splitext(base)[0] + "." + extension.lstrip(".")
+    outname = _os.path.join(outdir, base)
+    if outname in sources:
+      raise ValueError("%s and %s would both be written to %s" %
+                       (sources[outname], filename, outname))
+    sources[outname] = filename
+    tasks.append((filename, outname, stages))
+  if not _os.path.isdir(outdir):
+    _os.makedirs(outdir)
+  names = ["load"] + [s[0] for s in stages] + ["save"]
+  seconds = [0.0] * len(names)
+  pixels = 0
+  images = 0
+  failed = 0
+  start = _time.time()
+  pool = _mp.Pool(processes)
+  try:
+    # chunksize 1: a worker picks up the next file only when it is done
+    for filename, error, times, npixels in pool.imap_unordered(_process,
+                                                              tasks, 1):
+      if error is not None:
+        out.write("%s: %s\n" % (filename, error))
+        failed += 1
+        continue
+      images += 1
+      pixels += npixels
+      for i, (name, t) in enumerate(times):
+        seconds[i] += t
+  finally:
+    pool.close()
+    pool.join()
+  wall = _time.time() - start
+  out.write("%-14s %10s %12s\n" % ("stage", "seconds", "Mpixel/s"))
+  for name, t in zip(names, seconds):
+    rate = pixels / t / 1e6 if t > 0 else 0.0
+    out.write("%-14s %10.3f %12.2f\n" % (name, t, rate))
+  out.write("%d images, %.1f Mpixel, %.3f seconds wall clock, %d failed\n"
+            % (images, pixels / 1e6, wall, failed))
+  return failed
+
+# --------------------------------------------------------------------
+
+def main(argv):
+  parser = _optparse.OptionParser(
+    usage="%prog [options] -o OUTDIR -f FILTER ... FILE-OR-PATTERN ...")
+  parser.add_option("-o", "--output", dest="outdir",
+                    help="directory for the resulting images")
+  parser.add_option("-f", "--filter", dest="filters", action="append",
+                    default=[], help="add a filter, like 'blur(3)'")
+  parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                    help="number of worker processes (default: all cores)")
+  parser.add_option("-e", "--extension", dest="extension", default=None,
+                    help="file type of the results, like 'png'")
+  options, args = parser.parse_args(argv)
+  if not options.outdir or not args:
+    parser.error("need an output directory and at least one input file")
+  try:
+    stages = [parse_stage(f) for f in options.filters]
+  except (ValueError, SyntaxError) as e:
+    parser.error(str(e))
+  files = []
+  for pattern in args:
+    matches = sorted(_glob.glob(pattern))
+    if not matches:
+      _sys.stderr.write("No files match " + pattern + "\n")
+    files.extend(matches)
+  try:
+    failed = run(files, options.outdir, stages, options.jobs,
+                 options.extension)
+  except ValueError as e:
+    _sys.stderr.write(str(e) + "\n")
+    return 1
+  return 1 if failed else 0
+
+if __name__ == "__main__":
+  _sys.exit(main(_sys.argv[1:]))
+
+# --------------------------------------------------------------------
@@ -0,0 +1,273 @@
+#
+# cs1media_bench.py
+#
+# Benchmarks for cs1media and cs1media_filters.
+#
+# Example:
+#
+#   python cs1media_bench.py --sizes 640x480,2048x1536 -o results.json
+#
+# Every operation is timed on synthetic images of each size.  The images
+# are generated from a fixed random seed, so runs are reproducible.
+# Each operation runs in a fresh process, so that its peak memory use
+# can be measured: the growth of the peak memory from just before the
+# first run of the operation to just after it.  The results are written
+# as JSON, so that runs with different versions can be compared.
+#
+
+import json as _json
+import multiprocessing as _mp
+import optparse as _optparse
+import os as _os
+import platform as _platform
+import random as _random
+import shutil as _shutil
+import sys as _sys
+import tempfile as _tempfile
+import time as _time
+
+try:
+  import resource as _resource
+except ImportError:
+  _resource = None   # not available on Windows
+
+import Image as _Image
+
+import cs1media as _media
+import cs1media_filters as _filters
+
+# --------------------------------------------------------------------
+
+def synthetic_picture(width, height, seed = 101):
+  """Return a reproducible Picture of size width x height: a horizontal
+  gradient with random noise.  The image is filled strip by strip, so
+  building it needs little memory beyond the image itself."""
+  rnd = _random.Random(seed)
+  tw, th = min(width, 251), min(height, 241)
+  noise = "".join([chr(rnd.randint(0, 63)) for i in range(3 * tw * th)])
+  c1 = (rnd.randint(0, 192), rnd.randint(0, 192), 0)
+  c2 = (0, rnd.randint(0, 192), rnd.randint(0, 192))
+  row = []
+  for x in range(width):
+    t = float(x) / max(width - 1, 1)
+    row.extend([int(a + t * (b - a)) for a, b in zip(c1, c2)])
+  # noise added to the gradient, one tile wide and one strip high
+  noise_rows = []
+  for y in range(th):
+    line = noise[3 * tw * y:3 * tw * (y + 1)]
+    line = (line * (width // tw + 1))[:3 * width]
+    noise_rows.append("".join([chr(v + ord(n)) for v, n in zip(row, line)]))
+  strip = "".join(noise_rows)
+  surf = _Image.new("RGB", (width, height))
+  for y in range(0, height, th):
+    rows = min(th, height - y)
+    surf.paste(_media._frombytes("RGB", (width, rows),
+                                 strip[:3 * width * rows]), (0, y))
+  return _media.Picture(surf)
+
+# --------------------------------------------------------------------
+
+def _get_all(img):
+  w, h = img.size()
+  for y in range(h):
+    for x in range(w):
+      img.get(x, y)
+
+def _set_all(img):
+  w, h = img.size()
+  for y in range(h):
+    for x in range(w):
+      img.set(x, y, (x & 255, y & 255, 0))
+
+def _save(fmt):
+  def save(img, tmpdir):
+    img.save_as(_os.path.join(tmpdir, "bench." + fmt))
+  return save
+
+def _load(fmt):
+  def prepare(img, tmpdir):
+    filename = _os.path.join(tmpdir, "bench." + fmt)
+    img.save_as(filename)
+    return filename
+  def load(filename, tmpdir):
+    _media.load_picture(filename)
+  return prepare, load
+
+def _filter(name, *args):
+  def run(img, tmpdir):
+    getattr(_filters, name)(img, *args)
+  return run
+
+def _method(name, *args):
+  def run(img, tmpdir):
+    getattr(img, name)(*args)
+  return run
+
+_palette = [(0, 0, 0), (255, 255, 255), (200, 30, 30), (30, 200, 30),
+            (30, 30, 200), (200, 200, 30), (128, 128, 128), (60, 20, 90)]
+
+# name -> (prepare function or None, operation); the operation gets the
+# image (or whatever prepare returned) and a temporary directory
+operations = [
+  ("get", (None, lambda img, tmp: _get_all(img))),
+  ("set", (None, lambda img, tmp: _set_all(img))),
+  ("get_buffer", (None, _method("get_buffer"))),
+  ("load_png", _load("png")),
+  ("load_jpg", _load("jpg")),
+  ("save_png", (None, _save("png"))),
+  ("save_jpg", (None, _save("jpg"))),
+  ("copy", (None, _method("copy"))),
+  ("make_lighter", (None, _filter("make_lighter", 1.3))),
+  ("negative", (None, _filter("negative"))),
+  ("bw", (None, _filter("bw"))),
+  ("twolevels", (None, _filter("twolevels", 128))),
+  ("sepia", (None, _filter("sepia"))),
+  ("mirror", (None, _filter("mirror"))),
+  ("rotate", (None, _filter("rotate"))),
+  ("chroma", (None, _filter("chroma", (41, 75, 146), 70))),
+  ("blur_3", (None, _filter("blur", 3))),
+  ("blur_20", (None, _filter("blur", 20))),
+  ("edge_detect", (None, _filter("edge_detect", 20))),
+  ("posterize", (None, _filter("posterize", _palette))),
+  ("blocks", (None, _filter("blocks", 8))),
+  ("scale_down_2", (None, _method("scale_down", 2))),
+  ("resize_half", (None, lambda img, tmp: img.resize(img.size()[0] // 2,
+                                                     img.size()[1] // 2))),
+  ("histogram", (None, _method("histogram"))),
+]
+
+# --------------------------------------------------------------------
+
+def _max_rss():
+  # kilobytes on Linux (bytes on Mac OS)
+  if _resource is None:
+    return None
+  return _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+
+def _run_case(conn, name, width, height, repeat):
+  """Run in a fresh process: time operation name on an image of
+  the given size, and send the result through conn."""
+  try:
+    prepare, operation = dict(operations)[name]
+    tmpdir = _tempfile.mkdtemp()
+    try:
+      times = []
+      for i in range(repeat):
+        img = synthetic_picture(width, height)
+        arg = img if prepare is None else prepare(img, tmpdir)
+        if i == 0:
+          rss_before = _max_rss()
+        t = _time.time()
+        operation(arg, tmpdir)
+        times.append(_time.time() - t)
+        if i == 0:
+          rss_after = _max_rss()
+        del img, arg
+    finally:
+      _shutil.rmtree(tmpdir)
+    best = min(times)
+    result = { "operation": name, "width": width, "height": height,
+               "repeat": repeat, "seconds": best,
+               "mean_seconds": sum(times) / len(times),
+               "pixels_per_second": width * height / best if best else None,
+               "peak_rss_kb": rss_after,
+               "rss_growth_kb": (None if rss_after is None
+                                 else rss_after - rss_before) }
+    conn.send(result)
+  except Exception as e:
+    conn.send({ "operation": name, "width": width, "height": height,
+                "error": str(e) })
+  conn.close()
+
+def run_case(name, width, height, repeat = 3):
+  """Time operation name on an image of size width x height in a new
+  process, and return a dictionary with the results."""
+  parent, child = _mp.Pipe(False)
+  proc = _mp.Process(target=_run_case,
+                     args=(child, name, width, height, repeat))
+  proc.start()
+  # close our end, so that recv fails if the process dies
+  child.close()
+  try:
+    result = parent.recv()
+  except EOFError:
+    result = None
+  proc.join()
+  if result is None:
+    result = { "operation": name, "width": width, "height": height,
+               "error": "process died with exit code %s" % proc.exitcode,
+               "exitcode": proc.exitcode }
+  return result
+
+def environment():
+  """Return a dictionary describing the versions being benchmarked."""
+  return { "python": _platform.python_version(),
+           "platform": _platform.platform(),
+           "pil": getattr(_Image, "__version__",
+                          getattr(_Image, "VERSION", None)),
+           "numpy": None if _media._np is None else _media._np.__version__,
+           "cpus": _mp.cpu_count(),
+           "time": _time.strftime("%Y-%m-%d %H:%M:%S") }
+
+def run(sizes, names = None, repeat = 3, out = _sys.stdout):
+  """Run the benchmarks and return the results as a dictionary."""
+  if names is None:
+    names = [name for name, op in operations]
+  results = []
+  for width, height in sizes:
+    for name in names:
+      r = run_case(name, width, height, repeat)
+      results.append(r)
+      if "error" in r:
+        out.write("%-14s %5dx%-5d error: %s\n" % (name, width, height,
+                                                   r["error"]))
+      else:
+        out.write("%-14s %5dx%-5d %9.4f s %10.2f Mpixel/s %9s KB peak "
+                  "growth\n" % (name, width, height, r["seconds"],
+                                 (r["pixels_per_second"] or 0) / 1e6,
+                                 r["rss_growth_kb"]))
+  return { "environment": environment(), "results": results }
+
+# --------------------------------------------------------------------
+
+def main(argv):
+  parser = _optparse.OptionParser(usage="%prog [options]")
+  parser.add_option("-s", "--sizes", dest="sizes",
+                    default="256x256,1024x768,2048x1536",
+                    help="comma-separated image sizes, like 640x480")
+  parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                    help="how often to run each operation (best time counts)")
+  parser.add_option("-n", "--only", dest="only", default=None,
+                    help="comma-separated names of operations to run")
+  parser.add_option("-l", "--list", dest="list", action="store_true",
+                    default=False, help="list the operations and exit")
+  parser.add_option("-o", "--output", dest="output", default=None,
+                    help="write results as JSON to this file")
+  options, args = parser.parse_args(argv)
+  if options.list:
+    for name, op in operations:
+      print name
+    return 0
+  try:
+    sizes = [tuple(int(v) for v in s.split("x"))
+             for s in options.sizes.split(",")]
+  except ValueError:
+    parser.error("invalid sizes: " + options.sizes)
+  names = None
+  if options.only:
+    names = options.only.split(",")
+    known = dict(operations)
+    for name in names:
+      if name not in known:
+        parser.error("unknown operation: " + name)
+  results = run(sizes, names, options.repeat)
+  if options.output:
+    f = open(options.output, "w")
+    _json.dump(results, f, indent=2, sort_keys=True)
+    f.close()
+  return 0
+
+if __name__ == "__main__":
+  _sys.exit(main(_sys.argv[1:]))
+
+# --------------------------------------------------------------------
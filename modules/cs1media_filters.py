@@ -0,0 +1,791 @@
+#
+# cs1media_filters.py
+#
+# Fast versions of the image filters from the CS101 media lecture.
+#
+# The lecture implements every filter with a loop over all pixels
+# calling get and set.  The functions here compute exactly the same
+# result, but work on the whole image at once using PIL operations
+# (and NumPy, if it is installed).
+#
+# Use like this:
+#
+#   from cs1media import *
+#   import cs1media_filters as filters
+#
+#   img = load_picture("photos/statue.jpg")
+#   filters.sepia(img)
+#
+
+import math as _math
+import multiprocessing as _mp
+from multiprocessing import sharedctypes as _sharedctypes
+import Image as _Image
+import ImageChops as _ImageChops
+import ImageMath as _ImageMath
+
+import cs1media as _media
+
+_np = _media._np
+_luminance = _media._luminance
+
+# --------------------------------------------------------------------
+
+def _clip(v):
+  return max(0, min(v, 255))
+
+def _point(img, lut):
+  """Apply a lookup table with 768 entries to the image."""
+  img._reset(img._surf.point(lut))
+
+# --------------------------------------------------------------------
+
+def make_lighter(img, factor):
+  """Multiply all color values by factor."""
+  lut = [_clip(int(factor * v)) for v in range(256)]
+  _point(img, lut * 3)
+
+def make_redder(img, factor):
+  """Multiply green and blue values by factor."""
+  lut = [_clip(int(factor * v)) for v in range(256)]
+  _point(img, list(range(256)) + lut + lut)
+
+def negative(img):
+  """Turn image into its negative."""
+  lut = [255 - v for v in range(256)]
+  _point(img, lut * 3)
+
+def bw(img):
+  """Turn image into a black-and-white (grayscale) image."""
+  img._reset(_luminance(img._surf).convert("RGB"))
+
+def twolevels(img, threshold):
+  """Make pixels white if their luminance is above threshold,
+  and black otherwise."""
+  lut = [255 if v > threshold else 0 for v in range(256)]
+  img._reset(_luminance(img._surf).point(lut).convert("RGB"))
+
+def _sepia_tables():
+  red = []
+  blue = []
+  for v in range(256):
+    if v < 63:
+      r, b = int(1.1 * v), int(0.9 * v)
+    elif v < 192:
+      r, b = int(1.15 * v), int(0.85 * v)
+    else:
+      r, b = int(1.08 * v), int(0.93 * v)
+    red.append(min(r, 255))
+    blue.append(b)
+  return red, blue
+
+def sepia(img):
+  """Turn image into sepia tones."""
+  red, blue = _sepia_tables()
+  lum = _luminance(img._surf)
+  img._reset(_Image.merge("RGB", (lum.point(red), lum, lum.point(blue))))
+
+def _interpolate(t, c1, c2):
+  r1, g1, b1 = c1
+  r2, g2, b2 = c2
+  r = int((1-t) * r1 + t * r2)
+  g = int((1-t) * g1 + t * g2)
+  b = int((1-t) * b1 + t * b2)
+  return (r, g, b)
+
+def gradient(img, c1, c2):
+  """Fill image with a vertical gradient from color c1 at the top
+  to color c2 at the bottom."""
+  w, h = img.size()
+  column = _Image.new("RGB", (1, h))
+  column.putdata([_interpolate(float(y) / (h-1), c1, c2) for y in range(h)])
+  img._reset(column.resize((w, h), _Image.NEAREST))
+
+def mirror(img):
+  """Mirror image left-to-right."""
+  img._reset(img._surf.transpose(_Image.FLIP_LEFT_RIGHT))
+
+def reflect(img, x0, ltr = True):
+  """Reflect image at the vertical line x = x0.
+  If ltr is True, the left half is copied to the right half,
+  otherwise the right half is copied to the left half."""
+  w, h = img.size()
+  w0 = min(x0, w-x0-1)
+  if w0 <= 0:
+    return
+  if ltr:
+    src = (x0 - w0 + 1, 0, x0 + 1, h)
+    dst = (x0, 0, x0 + w0, h)
+  else:
+    src = (x0, 0, x0 + w0, h)
+    dst = (x0 - w0 + 1, 0, x0 + 1, h)
+  surf = img._modify()
+  surf.paste(surf.crop(src).transpose(_Image.FLIP_LEFT_RIGHT), dst)
+  img._modified(surf)
+
+def rotate(img):
+  """Return a new image, rotated by 90 degrees counter-clockwise."""
+  return img.rotate(90)
+
+# --------------------------------------------------------------------
+
+def _key_distance(surf, key):
+  """Return an I image with the squared distance of each pixel to key."""
+  r, g, b = surf.split()
+  kr, kg, kb = key
+  return _ImageMath.eval("(r-kr)*(r-kr) + (g-kg)*(g-kg) + (b-kb)*(b-kb)",
+                         r=r, g=g, b=b, kr=kr, kg=kg, kb=kb)
+
+def _key_mask(surf, key, threshold, inside = True):
+  """Return an L mask that is 255 where the pixel's distance to key is
+  less than threshold (if inside is True), or at least threshold
+  (if inside is False).  Compares squared distances, so no square roots
+  are needed."""
+  # for integer d, d < t * t is the same as d < ceil(t * t)
+  t2 = int(_math.ceil(threshold * threshold))
+  d = _key_distance(surf, key)
+  if inside:
+    return _ImageMath.eval("convert((d < t2) * 255, 'L')", d=d, t2=t2)
+  else:
+    return _ImageMath.eval("convert((d >= t2) * 255, 'L')", d=d, t2=t2)
+
+def chroma(img, key, threshold, color = _media.Color.yellow):
+  """Replace all pixels whose color is closer than threshold to key
+  by color."""
+  surf = img._modify()
+  surf.paste(color, None, _key_mask(surf, key, threshold))
+  img._modified(surf)
+
+def chroma_paste(canvas, img, x1, y1, key, threshold = 1):
+  """Paste img into canvas with its top left corner at x1, y1,
+  leaving out the pixels whose color is closer than threshold to key.
+  With the default threshold, only pixels of exactly color key are
+  left out.  To replace a colored background by the canvas, use a
+  larger threshold, so no separate call to chroma is needed."""
+  src = img._surf
+  surf = canvas._modify()
+  surf.paste(src, (x1, y1), _key_mask(src, key, threshold, False))
+  canvas._modified(surf)
+
+# --------------------------------------------------------------------
+
+def _box_average_band(data, w, h, n):
+  """Average over all n x n windows of a band given as a flat list,
+  using running sums along rows and then along columns."""
+  ow, oh = w - n + 1, h - n + 1
+  rows = []
+  for y in range(h):
+    row = data[y * w:(y + 1) * w]
+    s = sum(row[:n])
+    rows.append(s)
+    for x in range(ow - 1):
+      s += row[x + n] - row[x]
+      rows.append(s)
+  result = [0] * (ow * oh)
+  norm = n * n
+  for x in range(ow):
+    col = rows[x::ow]
+    s = sum(col[:n])
+    result[x] = s // norm
+    for y in range(oh - 1):
+      s += col[y + n] - col[y]
+      result[(y + 1) * ow + x] = s // norm
+  return result
+
+def _box_average(surf, radius):
+  """Return an image of size (w - 2 radius) x (h - 2 radius) containing
+  the average color over the (2 radius + 1) x (2 radius + 1) square
+  around each pixel of surf (rounded down, like in the lecture).
+  The cost does not depend on radius."""
+  w, h = surf.size
+  n = 2 * radius + 1
+  ow, oh = w - n + 1, h - n + 1
+  if _np is not None:
+    a = _np.frombuffer(_media._tobytes(surf), dtype=_np.uint8)
+    a = a.reshape((h, w, 3))
+    # summed-area table, with an extra row and column of zeros
+    s = _np.zeros((h + 1, w + 1, 3), dtype=_np.int64)
+    s[1:, 1:] = a.cumsum(axis=0, dtype=_np.int64).cumsum(axis=1)
+    box = s[n:, n:] - s[:-n, n:] - s[n:, :-n] + s[:-n, :-n]
+    box //= n * n
+    return _media._frombytes("RGB", (ow, oh), box.astype(_np.uint8).tostring())
+  bands = []
+  for band in surf.split():
+    result = _Image.new("L", (ow, oh))
+    result.putdata(_box_average_band(list(band.getdata()), w, h, n))
+    bands.append(result)
+  return _Image.merge("RGB", bands)
+
+def blur(img, radius):
+  """Return a new image where each pixel is the average of the
+  (2 radius + 1) x (2 radius + 1) square around it.  Pixels closer
+  than radius to the boundary are white."""
+  w, h = img.size()
+  result = _Image.new("RGB", (w, h), _media.Color.white)
+  if w > 2 * radius and h > 2 * radius:
+    result.paste(_box_average(img._surf, radius), (radius, radius))
+  return _media.Picture(result)
+
+def blur_rect(img, radius, x1, y1, x2, y2):
+  """Return a copy of the image where the rectangle x1 <= x < x2,
+  y1 <= y < y2 is blurred like in blur.  The rectangle must be at least
+  radius pixels away from the boundary, unless it is empty."""
+  w, h = img.size()
+  result = img._surf.copy()
+  if x1 >= x2 or y1 >= y2:
+    return _media.Picture(result)
+  box = (x1 - radius, y1 - radius, x2 + radius, y2 + radius)
+  if not (0 <= box[0] and 0 <= box[1] and box[2] <= w and box[3] <= h):
+    raise ValueError("Rectangle too close to boundary: " + 
+                     str((x1, y1, x2, y2)))
+  result.paste(_box_average(img._surf.crop(box), radius), (x1, y1))
+  return _media.Picture(result)
+
+def bounding_box(img, key, threshold):
+  """Return the smallest rectangle (x1, y1, x2, y2) such that all pixels
+  outside x1 <= x < x2, y1 <= y < y2 have distance at most threshold
+  from key.  Returns None if there is no pixel farther from key."""
+  # for integer d, d > t * t is the same as d > floor(t * t)
+  t2 = int(_math.floor(threshold * threshold))
+  d = _key_distance(img._surf, key)
+  mask = _ImageMath.eval("convert((d > t2) * 255, 'L')", d=d, t2=t2)
+  return mask.getbbox()
+
+def autocrop(img, threshold, key = None):
+  """Remove the border of color key (by default the color of the top
+  left pixel) around the image, where pixels within distance threshold
+  of key count as border.  Returns a view of img (see Picture.view), 
+  or None if all pixels belong to the border."""
+  if key is None:
+    key = img.get(0, 0)
+  box = bounding_box(img, key, threshold)
+  if box is None:
+    return None
+  return img.view(*box)
+
+# --------------------------------------------------------------------
+
+def edge_detect(img, threshold):
+  """Return a new black-and-white image where a pixel is black if its
+  luminance differs by more than threshold from both its left and its
+  upper neighbor, and white otherwise.  The pixels on the boundary are
+  black."""
+  w, h = img.size()
+  result = _Image.new("RGB", (w, h))
+  if w > 2 and h > 2:
+    lum = _luminance(img._surf)
+    p = lum.crop((1, 1, w-1, h-1))
+    left = _ImageChops.difference(lum.crop((0, 1, w-2, h-1)), p)
+    up = _ImageChops.difference(lum.crop((1, 0, w-1, h-2)), p)
+    lut = [0 if v > threshold else 255 for v in range(256)]
+    # white unless both differences are larger than threshold
+    edges = _ImageChops.lighter(left.point(lut), up.point(lut))
+    result.paste(edges.convert("RGB"), (1, 1))
+  return _media.Picture(result)
+
+def sobel(img, threshold):
+  """Return a new black-and-white image where a pixel is black if the
+  Sobel gradient |gx| + |gy| of the luminance is larger than threshold,
+  and white otherwise.  The pixels on the boundary are black."""
+  w, h = img.size()
+  result = _Image.new("RGB", (w, h))
+  if w > 2 and h > 2:
+    lum = _luminance(img._surf).convert("I")
+    n = {}
+    for dx in range(3):
+      for dy in range(3):
+        n["p%d%d" % (dx, dy)] = lum.crop((dx, dy, w-2+dx, h-2+dy))
+    n["t"] = threshold
+    edges = _ImageMath.eval("convert((abs((p20 + 2*p21 + p22) - "
+                            "(p00 + 2*p01 + p02)) + "
+                            "abs((p02 + 2*p12 + p22) - "
+                            "(p00 + 2*p10 + p20)) <= t) * 255, 'L')", **n)
+    result.paste(edges.convert("RGB"), (1, 1))
+  return _media.Picture(result)
+
+# --------------------------------------------------------------------
+
+class Palette(object):
+  """A list of colors for posterizing images.
+
+  Finding the closest palette color for every pixel is slow, so a
+  Palette computes a lookup table once: the color values are reduced to
+  5 bits each, and for each of the 32 x 32 x 32 cells of 8 x 8 x 8 colors
+  the table stores the palette color closest to its center.  It also
+  records the cells where that color is not the closest one for every
+  color in the cell; only pixels in those cells are compared with all
+  palette colors.  The result is exactly the closest color, like
+  find_closest in the lecture (the first one, if several are equally
+  close).  Reuse the same Palette object for many images to avoid
+  recomputing the table."""
+
+  def __init__(self, colors):
+    if not colors:
+      raise ValueError("Palette needs at least one color")
+    self._colors = [tuple(c) for c in colors]
+    self._table = None
+    self._ambiguous = None
+
+  def colors(self):
+    """Return the list of colors of the palette."""
+    return list(self._colors)
+
+  def _index(self, color):
+    r, g, b = color
+    return ((r >> 3) << 10) | ((g >> 3) << 5) | (b >> 3)
+
+  def _build_table(self):
+    # A cell is ambiguous if some other color q can be at least as close
+    # as the color p chosen for the center.  For a color x,
+    # |x - q|^2 - |x - p|^2 = |q|^2 - |p|^2 - 2 x.(q - p), which is
+    # linear in x, so its minimum over the cell is at a corner.
+    if _np is not None:
+      cells = _np.arange(32 * 32 * 32)
+      low = _np.empty((len(cells), 3), dtype=_np.int64)
+      low[:, 0] = ((cells >> 10) & 31) * 8
+      low[:, 1] = ((cells >> 5) & 31) * 8
+      low[:, 2] = (cells & 31) * 8
+      pal = _np.array(self._colors, dtype=_np.int64)
+      norm = (pal * pal).sum(axis=1)
+      order = _np.arange(len(pal))
+      table = _np.empty(len(cells), dtype=_np.intp)
+      ambiguous = _np.empty(len(cells), dtype=bool)
+      step = 4096
+      for i in range(0, len(cells), step):
+        lo = low[i:i+step]
+        d = (lo + 4)[:, None, :] - pal[None, :, :]
+        # argmin returns the first of several closest colors
+        best = (d * d).sum(axis=2).argmin(axis=1)
+        diff = pal[None, :, :] - pal[best][:, None, :]
+        most = _np.maximum(lo[:, None, :] * diff,
+                           (lo + 7)[:, None, :] * diff).sum(axis=2)
+        margin = norm[None, :] - norm[best][:, None] - 2 * most
+        # a color before best wins ties, so it must be strictly farther
+        bad = (margin < 0) | ((margin == 0) & (order[None, :] < best[:, None]))
+        table[i:i+step] = best
+        ambiguous[i:i+step] = bad.any(axis=1)
+      return table, ambiguous
+    table = []
+    ambiguous = []
+    colors = list(enumerate(self._colors))
+    for cell in range(32 * 32 * 32):
+      r = ((cell >> 10) & 31) * 8
+      g = ((cell >> 5) & 31) * 8
+      b = (cell & 31) * 8
+      best = self._closest((r + 4, g + 4, b + 4))
+      r0, g0, b0 = self._colors[best]
+      n0 = r0 * r0 + g0 * g0 + b0 * b0
+      bad = False
+      for i, (r1, g1, b1) in colors:
+        if i == best:
+          continue
+        dr, dg, db = r1 - r0, g1 - g0, b1 - b0
+        most = (max(r * dr, (r + 7) * dr) + max(g * dg, (g + 7) * dg) +
+                max(b * db, (b + 7) * db))
+        margin = r1 * r1 + g1 * g1 + b1 * b1 - n0 - 2 * most
+        if margin < 0 or (margin == 0 and i < best):
+          bad = True
+          break
+      table.append(best)
+      ambiguous.append(bad)
+    return table, ambiguous
+
+  def _closest(self, color):
+    # index of the first closest palette color
+    r, g, b = color
+    best, bestd = 0, None
+    for i, (r1, g1, b1) in enumerate(self._colors):
+      d = (r - r1)**2 + (g - g1)**2 + (b - b1)**2
+      if bestd is None or d < bestd:
+        best, bestd = i, d
+    return best
+
+  def table(self):
+    """Return the lookup table, computing it on first use."""
+    if self._table is None:
+      self._table, self._ambiguous = self._build_table()
+    return self._table
+
+  def closest(self, color):
+    """Return the palette color closest to color."""
+    i = self._index(color)
+    table = self.table()
+    if self._ambiguous[i]:
+      return self._colors[self._closest(color)]
+    return self._colors[table[i]]
+
+  def apply(self, surf):
+    """Return a new RGB image with each pixel of surf replaced by the
+    closest palette color."""
+    w, h = surf.size
+    table = self.table()
+    ambiguous = self._ambiguous
+    if _np is not None:
+      a = _np.frombuffer(_media._tobytes(surf), dtype=_np.uint8)
+      a = a.reshape((-1, 3))
+      idx = (a[:, 0] >> 3).astype(_np.intp) << 10
+      idx |= (a[:, 1] >> 3).astype(_np.intp) << 5
+      idx |= a[:, 2] >> 3
+      pal = _np.array(self._colors, dtype=_np.intp)
+      result = pal.astype(_np.uint8)[table][idx]
+      pos = _np.nonzero(ambiguous[idx])[0]
+      # compare the pixels in ambiguous cells with every color,
+      # one chunk at a time to limit memory
+      for i in range(0, len(pos), 65536):
+        p = pos[i:i+65536]
+        d = a[p].astype(_np.intp)[:, None, :] - pal[None, :, :]
+        result[p] = pal[(d * d).sum(axis=2).argmin(axis=1)]
+      return _media._frombytes("RGB", (w, h), result.tostring())
+    colors = [self._colors[i] for i in table]
+    index = self._index
+    exact = {}
+    data = []
+    for p in surf.getdata():
+      i = index(p)
+      if ambiguous[i]:
+        q = exact.get(p)
+        if q is None:
+          q = self._colors[self._closest(p)]
+          exact[p] = q
+        data.append(q)
+      else:
+        data.append(colors[i])
+    result = _Image.new("RGB", (w, h))
+    result.putdata(data)
+    return result
+
+_palettes = {}
+
+def _get_palette(colors):
+  if isinstance(colors, Palette):
+    return colors
+  key = tuple(tuple(c) for c in colors)
+  pal = _palettes.get(key)
+  if pal is None:
+    if len(_palettes) >= 16:
+      _palettes.clear()
+    pal = Palette(key)
+    _palettes[key] = pal
+  return pal
+
+def posterize(img, color_list):
+  """Replace every pixel by the closest color from color_list,
+  which can be a list of colors or a Palette.  The lookup table for
+  a list of colors is cached, so posterizing many images with the same
+  colors computes it only once."""
+  pal = _get_palette(color_list)
+  img._reset(pal.apply(img._surf))
+
+# --------------------------------------------------------------------
+
+class Pipeline(object):
+  """A sequence of filters applied to an image, computed lazily.
+
+  The filters are only recorded.  When the result is needed (by get,
+  size, show, save_as, or picture), all color filters are combined
+  into a single lookup table (plus one luminance computation, if
+  needed), and all mirrors and rotations into a single transposition.
+  The original image is not changed:
+
+    p = Pipeline(img).bw().twolevels(100).mirror()
+    p.save_as("result.png")
+  """
+
+  def __init__(self, img):
+    self._img = img
+    self._lut = list(range(256)) * 3
+    self._lum = None    # three tables from luminance to r, g, b
+    self._rotation = 0  # number of counter-clockwise 90 degree turns
+    self._flip = False  # mirror before rotating
+    self._result = None
+
+  def _channels(self, tables):
+    self._result = None
+    if self._lum is None:
+      self._lut = [tables[i // 256][v] for i, v in enumerate(self._lut)]
+    else:
+      self._lum = tuple([t[v] for v in lum] 
+                        for t, lum in zip(tables, self._lum))
+    return self
+
+  def _luminance(self, tables):
+    self._result = None
+    if self._lum is not None:
+      # the image is already a function of one luminance value
+      red, green, blue = self._lum
+      lum = [int(0.299 * red[v] + 0.587 * green[v] + 0.114 * blue[v])
+             for v in range(256)]
+      tables = tuple([t[v] for v in lum] for t in tables)
+    self._lum = tuple(tables)
+    return self
+
+  def make_lighter(self, factor):
+    """Add make_lighter(factor) to the pipeline."""
+    lut = [_clip(int(factor * v)) for v in range(256)]
+    return self._channels((lut, lut, lut))
+
+  def make_redder(self, factor):
+    """Add make_redder(factor) to the pipeline."""
+    lut = [_clip(int(factor * v)) for v in range(256)]
+    return self._channels((list(range(256)), lut, lut))
+
+  def negative(self):
+    """Add negative() to the pipeline."""
+    lut = [255 - v for v in range(256)]
+    return self._channels((lut, lut, lut))
+
+  def bw(self):
+    """Add bw() to the pipeline."""
+    lut = list(range(256))
+    return self._luminance((lut, lut, lut))
+
+  def twolevels(self, threshold):
+    """Add twolevels(threshold) to the pipeline."""
+    lut = [255 if v > threshold else 0 for v in range(256)]
+    return self._luminance((lut, lut, lut))
+
+  def sepia(self):
+    """Add sepia() to the pipeline."""
+    red, blue = _sepia_tables()
+    return self._luminance((red, list(range(256)), blue))
+
+  def mirror(self):
+    """Add mirror() to the pipeline."""
+    # mirror after rotating k times = rotating -k times after mirror
+    self._result = None
+    self._rotation = (-self._rotation) % 4
+    self._flip = not self._flip
+    return self
+
+  def rotate(self):
+    """Add rotate() to the pipeline."""
+    self._result = None
+    self._rotation = (self._rotation + 1) % 4
+    return self
+
+  def picture(self):
+    """Compute and return the result as a new Picture."""
+    if self._result is None:
+      surf = self._img._surf
+      if self._lut != list(range(256)) * 3:
+        surf = surf.point(self._lut)
+      if self._lum is not None:
+        lum = _luminance(surf)
+        surf = _Image.merge("RGB", [lum.point(t) for t in self._lum])
+      if self._flip:
+        surf = surf.transpose(_Image.FLIP_LEFT_RIGHT)
+      if self._rotation:
+        surf = surf.transpose([None, _Image.ROTATE_90, _Image.ROTATE_180,
+                               _Image.ROTATE_270][self._rotation])
+      elif surf is self._img._surf:
+        surf = surf.copy()
+      self._result = _media.Picture(surf)
+      self._result.set_title(self._img.title())
+    return self._result
+
+  def size(self):
+    """Return size of the resulting image as a tuple (width, height)."""
+    return self.picture().size()
+
+  def get(self, x, y):
+    """Return pixel at x, y of the resulting image."""
+    return self.picture().get(x, y)
+
+  def show(self):
+    """Display the resulting image."""
+    self.picture().show()
+
+  def save_as(self, filename = None):
+    """Save the resulting image as filename."""
+    self.picture().save_as(filename)
+
+# --------------------------------------------------------------------
+
+# shared pixel buffers, inherited by the worker processes of parallel
+_band_buffers = None
+
+def _band_init(src, dst, size):
+  global _band_buffers
+  _band_buffers = (src, dst, size)
+
+def _band_run(task):
+  func, args, y0, y1, halo = task
+  src, dst, (w, h) = _band_buffers
+  t0, t1 = max(0, y0 - halo), min(h, y1 + halo)
+  band = _media.Picture(_media._frombytes("RGB", (w, t1 - t0), 
+                                          src[3 * w * t0:3 * w * t1]))
+  result = func(band, *args)
+  if result is None:
+    result = band
+  if result.size() != (w, t1 - t0):
+    raise ValueError("parallel only works for filters that keep the size")
+  rows = result._surf.crop((0, y0 - t0, w, y1 - t0))
+  dst[3 * w * y0:3 * w * y1] = _media._tobytes(rows)
+
+def parallel(img, func, args = (), halo = 0, processes = None, bands = None):
+  """Apply func(img, *args) using several processes, and return the
+  result as a new Picture.
+
+  The image is split into horizontal bands, and each process applies
+  func to one band.  func can modify the band or return a new picture
+  of the same size.  If the result at a pixel depends on pixels up to
+  k rows away (for instance blur with radius k, or edge_detect with
+  k = 1), then pass halo = k, so that each band includes k extra rows
+  above and below.  The pixels are passed to the processes in shared
+  memory.  func must be a function defined at the top level of a
+  module."""
+  w, h = img.size()
+  if processes is None:
+    processes = _mp.cpu_count()
+  if bands is None:
+    bands = 4 * processes
+  bands = max(1, min(bands, h))
+  src = _sharedctypes.RawArray("c", _media._tobytes(img._surf))
+  dst = _sharedctypes.RawArray("c", 3 * w * h)
+  bounds = [h * i // bands for i in range(bands + 1)]
+  tasks = [(func, tuple(args), bounds[i], bounds[i + 1], halo) 
+           for i in range(bands)]
+  pool = _mp.Pool(processes, _band_init, (src, dst, (w, h)))
+  try:
+    pool.map(_band_run, tasks)
+  finally:
+    pool.close()
+    pool.join()
+  return _media.Picture(_media._frombytes("RGB", (w, h), dst.raw))
+
+# --------------------------------------------------------------------
+
+def _pixelate(img, step, x1, y1, nx, ny):
+  """Replace the nx x ny blocks of size step x step starting at x1, y1
+  by their average color (rounded down)."""
+  if nx <= 0 or ny <= 0:
+    return
+  box = (x1, y1, x1 + nx * step, y1 + ny * step)
+  small = _media._reduce(img._surf.crop(box), step, step)
+  surf = img._modify()
+  surf.paste(small.resize((nx * step, ny * step), _Image.NEAREST), box[:2])
+  img._modified(surf)
+
+def pixelate(img, step, x1 = 0, y1 = 0, x2 = None, y2 = None):
+  """Replace each step x step block in the rectangle x1 <= x < x2,
+  y1 <= y < y2 by its average color.  Blocks that do not fit
+  completely into the rectangle are not changed."""
+  x1, y1, x2, y2 = img._box(x1, y1, x2, y2)
+  _pixelate(img, step, x1, y1, (x2 - x1) // step, (y2 - y1) // step)
+
+def blocks(img, step):
+  """Replace each step x step block by its average color, 
+  exactly like blocks in the lecture."""
+  w, h = img.size()
+  # the lecture's loop does not touch the last row and column of blocks
+  _pixelate(img, step, 0, 0, (w - 1) // step, (h - 1) // step)
+
+def blocks_rect(img, step, x1, y1, x2, y2):
+  """Replace each step x step block in the rectangle x1 <= x < x2,
+  y1 <= y < y2 by its average color, like blocks_rect in the lecture."""
+  pixelate(img, step, x1, y1, x2, y2)
+
+# --------------------------------------------------------------------
+
+_halftone_tiles = {}
+
+def _halftone_tile(step):
+  """Return an L image of size step x step, where pixel x, y has value
+  step * x + y: this is the order in which the dots of a block turn
+  white as the brightness increases."""
+  tile = _halftone_tiles.get(step)
+  if tile is None:
+    tile = _Image.new("L", (step, step))
+    tile.putdata([step * x + y for y in range(step) for x in range(step)])
+    _halftone_tiles[step] = tile
+  return tile
+
+def _repeat(tile, size):
+  """Return an image of the given size covered with copies of tile,
+  using a logarithmic number of paste operations."""
+  w, h = size
+  tw, th = tile.size
+  img = _Image.new(tile.mode, (w, th))
+  img.paste(tile, (0, 0))
+  filled = tw
+  while filled < w:
+    img.paste(img.crop((0, 0, filled, th)), (filled, 0))
+    filled *= 2
+  result = _Image.new(tile.mode, (w, h))
+  result.paste(img, (0, 0))
+  filled = th
+  while filled < h:
+    result.paste(result.crop((0, 0, w, filled)), (0, filled))
+    filled *= 2
+  return result
+
+def newspaper(img, step = 4):
+  """Return a new black-and-white image that is step times larger than
+  img, where each pixel is replaced by a step x step block of black
+  and white dots with the same brightness, like newspaper in the
+  lecture.  The dot patterns are computed once for each step."""
+  if not 1 <= step <= 15:
+    raise ValueError("Halftone step must be between 1 and 15")
+  w, h = img.size()
+  levels = step * step + 1
+  lut = [v * levels // 256 for v in range(256)]
+  count = _luminance(img._surf).point(lut)
+  count = count.resize((step * w, step * h), _Image.NEAREST)
+  order = _repeat(_halftone_tile(step), (step * w, step * h))
+  # white where the dot's position in the order is less than the count
+  white = _ImageChops.subtract(count, order)
+  white = white.point([255 if v > 0 else 0 for v in range(256)])
+  return _media.Picture(white.convert("RGB"))
+
+# --------------------------------------------------------------------
+
+def _set_band(surf, channel, band):
+  bands = list(surf.split())
+  bands[channel] = band
+  return _Image.merge("RGB", bands)
+
+def extract_bitplane(img, bit = 0, channel = 0):
+  """Return a new black-and-white image that is black where the given bit
+  of the given color channel (0 = red, 1 = green, 2 = blue) is one, and
+  white where it is zero."""
+  band = img._surf.split()[channel]
+  mask = 1 << bit
+  lut = [0 if v & mask else 255 for v in range(256)]
+  return _media.Picture(band.point(lut).convert("RGB"))
+
+def clear_bitplane(img, bit = 0, channel = 0):
+  """Set the given bit of the given color channel to zero everywhere."""
+  band = img._surf.split()[channel]
+  mask = 1 << bit
+  band = band.point([v & ~mask for v in range(256)])
+  img._reset(_set_band(img._surf, channel, band))
+
+def write_bitplane(img, mask, x1 = 0, y1 = 0, bit = 0, channel = 0):
+  """Write the picture mask into the given bit of the given color channel,
+  with its top left corner at x1, y1: the bit becomes one where the
+  luminance of mask is less than 128, and zero where it is not."""
+  mw, mh = mask.size()
+  box = img._box(x1, y1, x1 + mw, y1 + mh)
+  surf = img._modify()
+  region = surf.crop(box)
+  band = region.split()[channel]
+  b = 1 << bit
+  ones = band.point([v | b for v in range(256)])
+  zeros = band.point([v & ~b for v in range(256)])
+  dark = _luminance(mask._surf).point([255 if v < 128 else 0 
+                                       for v in range(256)])
+  band = _Image.composite(ones, zeros, dark)
+  surf.paste(_set_band(region, channel, band), box[:2])
+  img._modified(surf)
+
+def encode(img, secret, x1, y1):
+  """Hide the black-and-white image secret in the lowest bit of the red
+  channel of img, with its top left corner at x1, y1."""
+  clear_bitplane(img)
+  write_bitplane(img, secret, x1, y1)
+
+def decode(img):
+  """Make the secret image hidden by encode visible."""
+  img._reset(extract_bitplane(img)._surf)
+
+# --------------------------------------------------------------------
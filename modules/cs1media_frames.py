@@ -0,0 +1,223 @@
+#
+# cs1media_frames.py
+#
+# Write a sequence of cs1media pictures as an animated GIF file
+# or as a directory of numbered image files.
+#
+# Example:
+#
+#   writer = FrameWriter("ball.gif", duration = 40)
+#   for i in range(1000):
+#     img.set_pixels((255, 255, 255))
+#     img.fill_rect(i, 100, i + 20, 120, (255, 0, 0))
+#     writer.add(img)
+#   writer.close()
+#
+# Frames are written as soon as they are added, and only the previous
+# frame is kept in memory, so animations can have any number of frames.
+# With differencing (the default), a GIF frame only contains the
+# rectangle that changed since the previous frame, and a frame that did
+# not change at all just makes the previous frame stay longer.
+#
+
+import io as _io
+import os as _os
+import shutil as _shutil
+import struct as _struct
+
+import Image as _Image
+import ImageChops as _ImageChops
+
+import cs1media as _media
+
+# --------------------------------------------------------------------
+
+def _gif_image(surf):
+  """Encode the RGB image surf as a GIF file, and return its color table,
+  whether it is interlaced, and the image data (the LZW code size
+  followed by the data blocks)."""
+  f = _io.BytesIO()
+  surf.convert("P", palette=_Image.ADAPTIVE).save(f, "GIF")
+  data = f.getvalue()
+  flags = ord(data[10:11])
+  pos = 13
+  table = b""
+  if flags & 0x80:
+    n = 3 << ((flags & 7) + 1)
+    table = data[pos:pos + n]
+    pos += n
+  while data[pos:pos + 1] == b"\x21":    # skip extensions
+    pos += 2
+    while ord(data[pos:pos + 1]):
+      pos += ord(data[pos:pos + 1]) + 1
+    pos += 1
+  if data[pos:pos + 1] != b"\x2c":
+    raise RuntimeError("Unexpected GIF data from PIL")
+  flags = ord(data[pos + 9:pos + 10])
+  interlaced = bool(flags & 0x40)
+  pos += 10
+  if flags & 0x80:
+    n = 3 << ((flags & 7) + 1)
+    table = data[pos:pos + n]
+    pos += n
+  start = pos
+  pos += 1                               # LZW minimum code size
+  while ord(data[pos:pos + 1]):
+    pos += ord(data[pos:pos + 1]) + 1
+  return table, interlaced, data[start:pos + 1]
+
+def _table_bits(table):
+  # size of the color table as stored in the flags byte
+  bits = 0
+  while (3 << (bits + 1)) < len(table):
+    bits += 1
+  return bits
+
+# --------------------------------------------------------------------
+
+class FrameWriter(object):
+  """Writes pictures one by one as the frames of an animation.
+
+  If target ends with ".gif", an animated GIF file is written, where
+  every frame is shown for duration milliseconds, and loop is the number
+  of repetitions (0 means forever).  Otherwise target is a directory,
+  and the frames are written to it as frame00000.png, frame00001.png,
+  and so on (format selects another file type).
+
+  If diff is True, only the parts of a frame that changed are encoded.
+  All frames must have the same size.  The GIF file is created when
+  the first frame is added, so no file is written if there are none."""
+
+  def __init__(self, target, duration = 100, loop = 0, diff = True,
+               format = "png"):
+    self._gif = target.lower().endswith(".gif")
+    self._target = target
+    self._duration = duration
+    self._loop = loop
+    self._diff = diff
+    self._format = format.lstrip(".")
+    self._size = None
+    self._previous = None    # the previous frame
+    self._pending = None     # the last GIF frame, not yet written
+    self._filename = None    # the last file written in a directory
+    self._count = 0
+    self._closed = False
+    self._file = None
+    if not self._gif and not _os.path.isdir(target):
+      _os.makedirs(target)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def count(self):
+    """Return the number of frames added so far."""
+    return self._count
+
+  def add(self, pict, duration = None):
+    """Add pict as the next frame.  The frame is shown for duration
+    milliseconds (by default the duration given to the writer).
+    pict can be a Picture or a TiledPicture, but a TiledPicture is
+    converted to a Picture, which needs memory for the entire image."""
+    if self._closed:
+      raise RuntimeError("FrameWriter is already closed")
+    if isinstance(pict, _media.TiledPicture):
+      pict = pict.to_picture()
+    surf = pict._surf
+    if self._size is None:
+      self._size = surf.size
+    elif surf.size != self._size:
+      raise ValueError("Frame size " + str(surf.size) +
+                       " does not match animation size " + str(self._size))
+    if duration is None:
+      duration = self._duration
+    box = (0, 0) + self._size
+    if self._diff and self._previous is not None:
+      box = _ImageChops.difference(surf, self._previous).getbbox()
+    if self._gif:
+      self._add_gif(surf, box, duration)
+    else:
+      self._add_file(surf, box)
+    # keep a copy, since the picture may be modified for the next frame
+    self._previous = surf.copy()
+    self._count += 1
+
+  def _add_file(self, surf, box):
+    filename = _os.path.join(self._target, "frame%05d.%s" %
+                             (self._count, self._format))
+    if box is None:
+      # same as the previous frame, no need to encode it again
+      try:
+        _os.link(self._filename, filename)
+      except (AttributeError, OSError):
+        _shutil.copyfile(self._filename, filename)
+    else:
+      surf.save(filename)
+    self._filename = filename
+
+  def _add_gif(self, surf, box, duration):
+    if box is None:
+      # unchanged: show the previous frame longer
+      self._pending[2] += duration
+      return
+    x1, y1, x2, y2 = box
+    if x2 - x1 == 1 and self._size[0] > 1:
+      # PIL encodes images that are one pixel wide incorrectly
+      x1 = min(x1, self._size[0] - 2)
+      box = (x1, y1, x1 + 2, y2)
+    if self._pending is None:
+      self._write_header()
+    else:
+      self._write_frame(*self._pending)
+    self._pending = [box, _gif_image(surf.crop(box)), duration]
+
+  def _write_header(self):
+    w, h = self._size
+    f = self._file = open(self._target, "wb")
+    f.write(b"GIF89a" + _struct.pack("<HHBBB", w, h, 0, 0, 0))
+    f.write(b"\x21\xff\x0bNETSCAPE2.0" +
+            _struct.pack("<BBHB", 3, 1, self._loop, 0))
+
+  def _write_frame(self, box, image, duration):
+    table, interlaced, data = image
+    x1, y1, x2, y2 = box
+    f = self._file
+    # graphic control extension: leave the frame in place, and set delay
+    f.write(_struct.pack("<BBBBHBB", 0x21, 0xf9, 4, 1 << 2,
+                         min(65535, (duration + 5) // 10), 0, 0))
+    f.write(_struct.pack("<BHHHHB", 0x2c, x1, y1, x2 - x1, y2 - y1,
+                         0x80 | (0x40 if interlaced else 0) |
+                         _table_bits(table)))
+    f.write(table)
+    f.write(data)
+
+  def close(self):
+    """Write the remaining frames and close the animation."""
+    if self._closed:
+      return
+    if self._pending is not None:
+      self._write_frame(*self._pending)
+      self._file.write(b"\x3b")
+      self._file.close()
+    self._pending = None
+    self._previous = None
+    self._closed = True
+
+# --------------------------------------------------------------------
+
+def save_animation(pictures, target, duration = 100, loop = 0,
+                   diff = True, format = "png"):
+  """Write all pictures as an animation (see FrameWriter).
+  pictures can be any iterable, like a generator that creates each
+  picture only when needed.  Returns the number of frames."""
+  writer = FrameWriter(target, duration, loop, diff, format)
+  try:
+    for pict in pictures:
+      writer.add(pict)
+  finally:
+    writer.close()
+  return writer.count()
+
+# --------------------------------------------------------------------
@@ -0,0 +1,363 @@
+#
+# test_cs1media.py
+#
+# Tests for cs1media: copies and views of pictures, tiled pictures,
+# and reading and writing PPM files.  Every test runs twice, with and
+# without NumPy.
+#
+# Run from this directory:
+#
+#   python test_cs1media.py
+#
+
+import io as _io
+import os as _os
+import random as _random
+import shutil as _shutil
+import tempfile as _tempfile
+import unittest as _unittest
+
+import cs1media as _media
+import cs1media_filters as _filters
+
+# --------------------------------------------------------------------
+
+def random_picture(w, h, seed):
+  """Return a w x h picture of random pixels."""
+  rnd = _random.Random(seed)
+  data = [(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255))
+          for i in range(w * h)]
+  p = _media.create_picture(w, h)
+  p.set_region(0, 0, w, h, data)
+  return p
+
+class MediaTest(_unittest.TestCase):
+  """Base class: runs with or without NumPy."""
+
+  numpy = True
+
+  def setUp(self):
+    if self.numpy and _media._np is None:
+      self.skipTest("NumPy is not installed")
+    self._saved = (_media._np, _filters._np)
+    if not self.numpy:
+      _media._np = _filters._np = None
+
+  def tearDown(self):
+    _media._np, _filters._np = self._saved
+
+  def assertSame(self, a, b, msg = None):
+    self.assertEqual(a.size(), b.size(), msg)
+    self.assertEqual(a.get_region(), b.get_region(), msg)
+
+# --------------------------------------------------------------------
+
+class CopyTest(MediaTest):
+  """Copies share their pixels until one side is modified."""
+
+  def test_copy_shares_until_written(self):
+    p = random_picture(7, 5, 1)
+    q = p.copy()
+    self.assertTrue(q._surf is p._surf)
+    q.set(2, 3, (1, 2, 3))
+    self.assertFalse(q._surf is p._surf)
+    self.assertEqual(q.get(2, 3), (1, 2, 3))
+    self.assertSame(p, random_picture(7, 5, 1))
+
+  def test_write_original(self):
+    p = random_picture(7, 5, 1)
+    q = p.copy()
+    r = p.copy()
+    p.set(0, 0, (9, 9, 9))
+    p.fill_rect(1, 1, 4, 4, (5, 6, 7))
+    self.assertSame(q, random_picture(7, 5, 1))
+    self.assertSame(r, random_picture(7, 5, 1))
+    # q and r still share with each other
+    self.assertTrue(q._surf is r._surf)
+    r.set(6, 4, (0, 0, 0))
+    self.assertSame(q, random_picture(7, 5, 1))
+
+  def test_copy_of_copy(self):
+    p = random_picture(6, 6, 2)
+    q = p.copy().copy()
+    q.set(1, 1, (4, 4, 4))
+    self.assertSame(p, random_picture(6, 6, 2))
+    p.set(1, 1, (8, 8, 8))
+    self.assertEqual(q.get(1, 1), (4, 4, 4))
+
+  def test_replace_surface(self):
+    p = random_picture(6, 4, 3)
+    q = p.copy()
+    q.set_pixels((10, 20, 30))
+    self.assertSame(p, random_picture(6, 4, 3))
+    q.set(0, 0, (1, 1, 1))
+    self.assertSame(p, random_picture(6, 4, 3))
+    p.set(0, 0, (2, 2, 2))
+    self.assertEqual(q.get(0, 0), (1, 1, 1))
+    self.assertEqual(q.get(1, 0), (10, 20, 30))
+
+  def test_filters_on_copy(self):
+    for name, args in (("negative", ()), ("bw", ()), ("sepia", ()),
+                       ("make_lighter", (1.3,)), ("mirror", ()),
+                       ("blocks", (2,))):
+      p = random_picture(9, 7, 4)
+      q = p.copy()
+      getattr(_filters, name)(q, *args)
+      self.assertSame(p, random_picture(9, 7, 4), name)
+      expected = random_picture(9, 7, 4)
+      getattr(_filters, name)(expected, *args)
+      self.assertSame(q, expected, name)
+
+  def test_dropped_copy(self):
+    p = random_picture(5, 5, 5)
+    q = p.copy()
+    del q
+    p.set(2, 2, (3, 3, 3))
+    self.assertEqual(p.get(2, 2), (3, 3, 3))
+
+# --------------------------------------------------------------------
+
+class ViewTest(MediaTest):
+  """Views write through to their picture, and the other way round."""
+
+  def test_view_reads_parent(self):
+    p = random_picture(10, 8, 6)
+    v = p.view(2, 3, 7, 8)
+    self.assertEqual(v.size(), (5, 5))
+    self.assertEqual(v.get_region(), p.get_region(2, 3, 7, 8))
+    p.set(4, 4, (1, 2, 3))
+    self.assertEqual(v.get(2, 1), (1, 2, 3))
+
+  def test_view_writes_parent(self):
+    p = random_picture(10, 8, 6)
+    v = p.view(2, 3, 7, 8)
+    v.set(0, 0, (7, 7, 7))
+    self.assertEqual(p.get(2, 3), (7, 7, 7))
+    v.fill_rect(1, 1, 3, 2, (4, 5, 6))
+    self.assertEqual(p.get_region(3, 4, 5, 5), [(4, 5, 6)] * 2)
+    _filters.negative(v)
+    self.assertEqual(p.get(3, 4), (251, 250, 249))
+    expected = random_picture(10, 8, 6)
+    expected.set(2, 3, (7, 7, 7))
+    expected.fill_rect(3, 4, 5, 5, (4, 5, 6))
+    self.assertEqual(p.get_region(0, 0, 10, 3),
+                     expected.get_region(0, 0, 10, 3))
+    self.assertEqual(p.get_region(0, 3, 2, 8),
+                     expected.get_region(0, 3, 2, 8))
+
+  def test_nested_view(self):
+    p = random_picture(10, 8, 7)
+    v = p.view(2, 2, 9, 8).view(1, 2, 4, 5)
+    self.assertEqual(v.get_region(), p.get_region(3, 4, 6, 7))
+    v.set(2, 2, (0, 1, 2))
+    self.assertEqual(p.get(5, 6), (0, 1, 2))
+
+  def test_view_bounds(self):
+    p = random_picture(10, 8, 8)
+    v = p.view(2, 2, 5, 4)
+    for x, y in ((3, 0), (0, 2), (-1, 0), (0, -1)):
+      self.assertRaises(IndexError, v.get, x, y)
+      self.assertRaises(IndexError, v.set, x, y, (0, 0, 0))
+    self.assertRaises(ValueError, p.view, 2, 2, 11, 4)
+    self.assertRaises(ValueError, p.view, 5, 2, 4, 4)
+
+  def test_view_of_copy(self):
+    p = random_picture(8, 6, 9)
+    q = p.copy()
+    v = q.view(1, 1, 5, 5)
+    v.set(0, 0, (1, 1, 1))
+    self.assertEqual(q.get(1, 1), (1, 1, 1))
+    self.assertSame(p, random_picture(8, 6, 9))
+
+  def test_copy_of_view(self):
+    p = random_picture(8, 6, 10)
+    c = p.view(1, 1, 5, 5).copy()
+    c.set(0, 0, (1, 1, 1))
+    self.assertSame(p, random_picture(8, 6, 10))
+    p.set(2, 2, (3, 3, 3))
+    self.assertNotEqual(c.get(1, 1), (3, 3, 3))
+
+  def test_view_size_mismatch(self):
+    v = random_picture(8, 6, 11).view(1, 1, 5, 5)
+    self.assertRaises(ValueError, v._reset, _media.create_picture(3, 3)._surf)
+
+# --------------------------------------------------------------------
+
+class TiledTest(MediaTest):
+  """A TiledPicture holds the same pixels as a Picture."""
+
+  def setUp(self):
+    MediaTest.setUp(self)
+    self.tmpdir = _tempfile.mkdtemp()
+
+  def tearDown(self):
+    _shutil.rmtree(self.tmpdir)
+    MediaTest.tearDown(self)
+
+  def tiled_copy(self, p, tile_size = 4, cache_size = 2):
+    """Return a TiledPicture with the pixels of p, set pixel by pixel."""
+    w, h = p.size()
+    t = _media.create_tiled_picture(w, h, (0, 0, 0), tile_size, cache_size)
+    for y in range(h):
+      for x in range(w):
+        t.set(x, y, p.get(x, y))
+    return t
+
+  def test_get_set(self):
+    p = random_picture(11, 9, 12)
+    t = self.tiled_copy(p)
+    # reading back in another order evicts the tiles again
+    for x in range(11):
+      for y in range(9):
+        self.assertEqual(t.get(x, y), p.get(x, y))
+    self.assertSame(t.to_picture(), p)
+
+  def test_set_pixels(self):
+    t = _media.create_tiled_picture(7, 5, (1, 2, 3), 3, 1)
+    self.assertSame(t.to_picture(), _media.create_picture(7, 5, (1, 2, 3)))
+    t.set(6, 4, (9, 9, 9))
+    t.set_pixels((4, 5, 6))
+    self.assertSame(t.to_picture(), _media.create_picture(7, 5, (4, 5, 6)))
+
+  def test_bounds(self):
+    t = _media.create_tiled_picture(5, 4)
+    for x, y in ((5, 0), (0, 4), (-1, 0), (0, -1)):
+      self.assertRaises(IndexError, t.get, x, y)
+      self.assertRaises(IndexError, t.set, x, y, (0, 0, 0))
+    self.assertRaises(ValueError, _media.create_tiled_picture, 0, 4)
+
+  def test_save_and_load(self):
+    p = random_picture(13, 10, 13)
+    t = self.tiled_copy(p, 5, 3)
+    t.set_title("tiled")
+    self.assertEqual(t.to_picture().title(), "tiled")
+    for ext in ("ppm", "png"):
+      filename = _os.path.join(self.tmpdir, "tiled." + ext)
+      t.save_as(filename)
+      self.assertSame(_media.load_picture(filename), p, ext)
+      u = _media.load_tiled_picture(filename, 4, 2)
+      self.assertEqual(u.title(), filename)
+      self.assertSame(u.to_picture(), p, ext)
+
+  def test_load_gray(self):
+    p = random_picture(9, 6, 14)
+    filename = _os.path.join(self.tmpdir, "gray.pgm")
+    f = open(filename, "wb")
+    p.write_ppm(f, True)
+    f.close()
+    gray = _media.load_picture(filename)
+    self.assertSame(_media.load_tiled_picture(filename, 4, 1).to_picture(),
+                    gray)
+    t = self.tiled_copy(p, 4, 1)
+    f = open(filename, "wb")
+    t.write_ppm(f, True)
+    f.close()
+    self.assertSame(_media.load_picture(filename), gray)
+
+# --------------------------------------------------------------------
+
+class _Pipe(object):
+  """A file object that returns at most n bytes per read, like a pipe."""
+
+  def __init__(self, data, n):
+    self._f = _io.BytesIO(data)
+    self._n = n
+
+  def read(self, size):
+    return self._f.read(min(size, self._n))
+
+def _gray(p):
+  """Return p with every pixel replaced by its luminance."""
+  q = p.copy()
+  w, h = q.size()
+  for y in range(h):
+    for x in range(w):
+      r, g, b = q.get(x, y)
+      v = int(0.299 * r + 0.587 * g + 0.114 * b)
+      q.set(x, y, (v, v, v))
+  return q
+
+class PPMTest(MediaTest):
+  """Pictures written by write_ppm and write_raw are read back exactly."""
+
+  def test_round_trip(self):
+    for w, h in ((1, 1), (13, 7), (300, 2)):
+      p = random_picture(w, h, w)
+      f = _io.BytesIO()
+      p.write_ppm(f)
+      data = f.getvalue()
+      self.assertTrue(data.startswith(b"P6\n%d %d\n255\n" % (w, h)))
+      self.assertSame(_media.read_ppm(_io.BytesIO(data)), p)
+      f = _io.BytesIO()
+      p.write_raw(f)
+      self.assertEqual(len(f.getvalue()), 3 * w * h)
+      f.seek(0)
+      self.assertSame(_media.read_raw(f, w, h), p)
+      self.assertEqual(_media.read_raw(f, w, h), None)
+
+  def test_gray(self):
+    p = random_picture(9, 8, 15)
+    f = _io.BytesIO()
+    p.write_ppm(f, True)
+    self.assertEqual(len(f.getvalue()), len(b"P5\n9 8\n255\n") + 9 * 8)
+    f.seek(0)
+    self.assertSame(_media.read_ppm(f), _gray(p))
+
+  def test_view(self):
+    p = random_picture(9, 8, 16)
+    f = _io.BytesIO()
+    p.view(2, 1, 7, 5).write_ppm(f)
+    f.seek(0)
+    self.assertSame(_media.read_ppm(f), p.view(2, 1, 7, 5))
+
+  def test_stream(self):
+    pictures = [random_picture(5, 4, 17), random_picture(3, 6, 18),
+                random_picture(0, 2, 19), random_picture(7, 7, 20)]
+    f = _io.BytesIO()
+    for i, p in enumerate(pictures):
+      p.write_ppm(f, i == 1)
+    f = _Pipe(f.getvalue(), 5)
+    for i, p in enumerate(pictures):
+      self.assertSame(_media.read_ppm(f), _gray(p) if i == 1 else p)
+    self.assertEqual(_media.read_ppm(f), None)
+    self.assertEqual(_media.read_ppm(_io.BytesIO(b"")), None)
+    self.assertEqual(_media.read_ppm(_io.BytesIO(b"\n  \n")), None)
+
+  def test_comments(self):
+    data = b"P6 # comment\n# another\n2 1\n#\n255\n\x01\x02\x03abc"
+    p = _media.read_ppm(_io.BytesIO(data))
+    self.assertEqual(p.get_region(), [(1, 2, 3), (97, 98, 99)])
+
+  def test_errors(self):
+    for data in (b"P3\n1 1\n255\n000", b"P6\n1 1\n65535\n000000",
+                 b"P6\n1 x\n255\n000", b"P6\n1 1\n", b"P6\n2 1\n255\n000",
+                 b"P6\n2 1\n255\n"):
+      self.assertRaises(ValueError, _media.read_ppm, _io.BytesIO(data))
+    self.assertRaises(ValueError, _media.read_raw, _io.BytesIO(b"0000"), 2, 1)
+
+class CopyTestWithoutNumpy(CopyTest):
+  """The same tests, using the code paths without NumPy."""
+
+  numpy = False
+
+class ViewTestWithoutNumpy(ViewTest):
+  """The same tests, using the code paths without NumPy."""
+
+  numpy = False
+
+class TiledTestWithoutNumpy(TiledTest):
+  """The same tests, using the code paths without NumPy."""
+
+  numpy = False
+
+class PPMTestWithoutNumpy(PPMTest):
+  """The same tests, using the code paths without NumPy."""
+
+  numpy = False
+
+# --------------------------------------------------------------------
+
+if __name__ == "__main__":
+  _unittest.main()
+
+# --------------------------------------------------------------------
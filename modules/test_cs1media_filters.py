@@ -0,0 +1,258 @@
+#
+# test_cs1media_filters.py
+#
+# Checks that the filters in cs1media_filters compute exactly the same
+# pixels as the loops in code/chroma/media.py from the lecture, on
+# random images, and that a Pipeline and parallel compute the same as
+# the filters they use.  Every test runs twice, with and without NumPy.
+#
+# Run from this directory:
+#
+#   python test_cs1media_filters.py
+#
+
+import os as _os
+import random as _random
+import unittest as _unittest
+
+import cs1media as _media
+import cs1media_filters as _filters
+
+# --------------------------------------------------------------------
+
+_media_py = _os.path.join(_os.path.dirname(_os.path.abspath(__file__)),
+                          "..", "code", "chroma", "media.py")
+
+def _load_reference():
+  """Return the namespace of media.py, without running its demo."""
+  src = open(_media_py).read()
+  src = src.replace("\nnews_test()", "\n")
+  ns = {}
+  exec(src, ns)
+  return ns
+
+ref = _load_reference()
+
+def random_picture(w, h, seed, colors = None):
+  """Return a w x h picture of random pixels, chosen from colors
+  if given."""
+  rnd = _random.Random(seed)
+  if colors is None:
+    data = [(rnd.randint(0, 255), rnd.randint(0, 255), rnd.randint(0, 255))
+            for i in range(w * h)]
+  else:
+    data = [rnd.choice(colors) for i in range(w * h)]
+  p = _media.create_picture(w, h)
+  p.set_region(0, 0, w, h, data)
+  return p
+
+_sizes = [(1, 1), (2, 3), (23, 17), (24, 16), (31, 9)]
+
+# --------------------------------------------------------------------
+
+class FilterTest(_unittest.TestCase):
+  """Compares each filter with the loop from media.py."""
+
+  numpy = True
+
+  def setUp(self):
+    if self.numpy and _media._np is None:
+      self.skipTest("NumPy is not installed")
+    self._saved = (_media._np, _filters._np)
+    if not self.numpy:
+      _media._np = _filters._np = None
+    _filters._palettes.clear()
+
+  def tearDown(self):
+    _media._np, _filters._np = self._saved
+
+  def assertSame(self, a, b, msg = None):
+    self.assertEqual(a.size(), b.size(), msg)
+    self.assertEqual(a.get_region(), b.get_region(), msg)
+
+  def check_in_place(self, name, args, sizes = _sizes, colors = None,
+                     ours = None):
+    """Apply media.py's name and ours (by default the filter of the same
+    name) to copies of random pictures, and compare."""
+    ours = ours or getattr(_filters, name)
+    for seed, (w, h) in enumerate(sizes):
+      p = random_picture(w, h, seed, colors)
+      a, b = p.copy(), p.copy()
+      ref[name](a, *args)
+      ours(b, *args)
+      self.assertSame(a, b, "%s%r on %dx%d" % (name, args, w, h))
+
+  def check_result(self, name, args, sizes = _sizes, ours = None):
+    """Like check_in_place, for filters that return a new picture."""
+    ours = ours or getattr(_filters, name)
+    for seed, (w, h) in enumerate(sizes):
+      p = random_picture(w, h, seed)
+      self.assertSame(ref[name](p, *args), ours(p, *args),
+                      "%s%r on %dx%d" % (name, args, w, h))
+      self.assertSame(p, random_picture(w, h, seed))
+
+  def test_color_filters(self):
+    self.check_in_place("make_lighter", (1.3,))
+    self.check_in_place("make_lighter", (0.7,))
+    self.check_in_place("make_redder", (0.5,))
+    self.check_in_place("negative", ())
+    self.check_in_place("bw", ())
+    self.check_in_place("sepia", ())
+    for t in (0, 100, 128, 255):
+      self.check_in_place("twolevels", (t,))
+    # pictures without pixels are left alone
+    for name, args in (("bw", ()), ("twolevels", (128,)), ("sepia", ())):
+      self.check_in_place(name, args, [(0, 3), (4, 0), (0, 0)])
+
+  def test_gradient(self):
+    sizes = [(1, 2), (5, 7), (13, 40)]
+    self.check_in_place("gradient", ((10, 200, 30), (250, 0, 99)), sizes)
+    self.check_in_place("gradient", ((0, 0, 0), (255, 255, 255)), sizes)
+
+  def test_mirror_reflect_rotate(self):
+    self.check_in_place("mirror", ())
+    for x0 in (0, 5, 11, 22):
+      sizes = [(23, 17), (24, 6)]
+      self.check_in_place("reflect", (x0, True), sizes)
+      self.check_in_place("reflect", (x0, False), sizes)
+    self.check_result("rotate", ())
+
+  def test_chroma(self):
+    colors = [(41, 75, 146), (40, 80, 140), (200, 10, 10), (41, 75, 200)]
+    for t in (1, 8, 9, 70):
+      self.check_in_place("chroma", ((41, 75, 146), t), colors=colors)
+    self.check_in_place("chroma", ((41, 75, 146), 70))
+
+  def test_chroma_paste(self):
+    key = (255, 255, 0)
+    for x1, y1 in ((0, 0), (3, 5), (10, 2)):
+      a = random_picture(23, 17, 1)
+      b = a.copy()
+      img = random_picture(9, 8, 2, [key, (1, 2, 3), (255, 255, 1)])
+      ref["chroma_paste"](a, img, x1, y1, key)
+      _filters.chroma_paste(b, img, x1, y1, key)
+      self.assertSame(a, b)
+
+  def test_blur(self):
+    for r in (0, 1, 2, 5):
+      self.check_result("blur", (r,))
+    for r, box in ((1, (1, 1, 5, 4)), (2, (2, 3, 20, 14)),
+                   (1, (3, 3, 3, 5)), (1, (5, 0, 2, 5))):
+      self.check_result("blur_rect", (r,) + box, [(23, 17)])
+
+  def test_blocks(self):
+    for step in (1, 2, 4, 5):
+      self.check_in_place("blocks", (step,))
+    self.check_in_place("blocks_rect", (3, 2, 1, 20, 13), [(23, 17)])
+    self.check_in_place("blocks_rect", (4, 0, 0, 24, 16), [(24, 16)])
+
+  def test_edge_detect(self):
+    for t in (0, 10, 40):
+      self.check_result("edge_detect", (t,))
+
+  def test_scale_down(self):
+    for factor in (1, 2, 3):
+      self.check_result("scale_down", (factor,), [(23, 17), (24, 16)],
+                        ours = lambda img, f: img.scale_down(f))
+    # factors larger than the picture give an empty picture
+    for factor in (5, 10):
+      self.check_result("scale_down", (factor,), [(5, 4), (1, 1)],
+                        ours = lambda img, f: img.scale_down(f))
+
+  def test_newspaper(self):
+    self.check_result("newspaper", (), [(1, 1), (7, 5)])
+
+  def test_posterize(self):
+    rnd = _random.Random(7)
+    for n in (1, 2, 10, 40):
+      palette = [(rnd.randint(0, 255), rnd.randint(0, 255),
+                  rnd.randint(0, 255)) for i in range(n)]
+      palette.append(palette[0])
+      self.check_in_place("posterize", (palette,))
+    # colors exactly halfway between two palette colors
+    palette = [(0, 0, 0), (10, 0, 0), (10, 0, 0), (0, 20, 0)]
+    colors = [(x, y, 0) for x in range(16) for y in range(16)]
+    self.check_in_place("posterize", (palette,), colors=colors)
+
+  def test_encode_decode(self):
+    for x1, y1 in ((0, 0), (4, 3)):
+      a = random_picture(23, 17, 3)
+      b = a.copy()
+      secret = random_picture(12, 9, 4)
+      ref["encode"](a, secret, x1, y1)
+      _filters.encode(b, secret, x1, y1)
+      self.assertSame(a, b)
+      ref["decode"](a)
+      _filters.decode(b)
+      self.assertSame(a, b)
+
+  def test_autocrop(self):
+    # autocrop keeps the last row and column, which the crop in media.py
+    # cuts off, so compare with the scans that media.py uses
+    key = (10, 20, 30)
+    for seed, (x1, y1, x2, y2) in enumerate([(3, 2, 10, 8), (0, 0, 1, 1),
+                                              (5, 1, 12, 10)]):
+      p = _media.create_picture(12, 10, key)
+      inner = random_picture(x2 - x1, y2 - y1, seed)
+      p.paste(inner, x1, y1)
+      for t in (0, 50):
+        box = (ref["auto_left"](p, key, t), ref["auto_up"](p, key, t),
+               ref["auto_right"](p, key, t) + 1,
+               ref["auto_down"](p, key, t) + 1)
+        self.assertEqual(_filters.bounding_box(p, key, t), box)
+        self.assertSame(_filters.autocrop(p, t, key), ref["crop"](p, *box))
+    self.assertEqual(_filters.autocrop(_media.create_picture(4, 4), 0), None)
+
+  def test_pipeline(self):
+    steps = [("make_lighter", (1.3,)), ("make_lighter", (0.6,)),
+             ("make_redder", (0.5,)), ("negative", ()), ("bw", ()),
+             ("twolevels", (100,)), ("sepia", ()), ("mirror", ()),
+             ("rotate", ())]
+    rnd = _random.Random(5)
+    for seed in range(40):
+      chain = [rnd.choice(steps) for i in range(rnd.randint(0, 6))]
+      p = random_picture(7, 5, seed)
+      pipe = _filters.Pipeline(p)
+      expected = p.copy()
+      for name, args in chain:
+        getattr(pipe, name)(*args)
+        expected = getattr(_filters, name)(expected, *args) or expected
+      self.assertSame(pipe.picture(), expected, str(chain))
+      self.assertEqual(pipe.size(), expected.size())
+      self.assertEqual(pipe.get(0, 1), expected.get(0, 1))
+      self.assertSame(p, random_picture(7, 5, seed))
+    # adding a step after computing the result
+    pipe = _filters.Pipeline(random_picture(4, 3, 1)).bw()
+    pipe.picture()
+    expected = random_picture(4, 3, 1)
+    _filters.bw(expected)
+    _filters.negative(expected)
+    self.assertSame(pipe.negative().picture(), expected)
+
+  def test_parallel(self):
+    p = random_picture(23, 17, 6)
+    for func, args, halo in ((_filters.negative, (), 0),
+                             (_filters.make_lighter, (1.3,), 0),
+                             (_filters.blur, (2,), 2),
+                             (_filters.edge_detect, (20,), 1)):
+      expected = p.copy()
+      expected = func(expected, *args) or expected
+      for bands in (1, 3, 17, 40):
+        result = _filters.parallel(p, func, args, halo, 2, bands)
+        self.assertSame(result, expected, "%s with %d bands" %
+                        (func.__name__, bands))
+    self.assertSame(p, random_picture(23, 17, 6))
+    self.assertRaises(ValueError, _filters.parallel, p, _filters.rotate,
+                      (), 0, 2)
+
+class FilterTestWithoutNumpy(FilterTest):
+  """The same tests, using the code paths without NumPy."""
+
+  numpy = False
+
+# --------------------------------------------------------------------
+
+if __name__ == "__main__":
+  _unittest.main()
+
+# --------------------------------------------------------------------
@@ -0,0 +1,166 @@
+#
+# test_cs1media_frames.py
+#
+# Checks that the animations written by cs1media_frames show the
+# pictures that were added.  GIF files are split into their frames,
+# which are decoded by PIL and put together like a browser does.
+#
+# Run from this directory:
+#
+#   python test_cs1media_frames.py
+#
+
+import io as _io
+import os as _os
+import random as _random
+import shutil as _shutil
+import struct as _struct
+import tempfile as _tempfile
+import unittest as _unittest
+
+import Image as _Image
+
+import cs1media as _media
+import cs1media_frames as _frames
+
+# --------------------------------------------------------------------
+
+_colors = [(255, 255, 255), (255, 0, 0), (0, 0, 255), (10, 200, 30)]
+
+def frames(n, w = 20, h = 15, seed = 0):
+  """Return n pictures of a moving rectangle over a few random pixels,
+  using only a few colors, so that GIF encodes them exactly."""
+  rnd = _random.Random(seed)
+  result = []
+  p = _media.create_picture(w, h, _colors[0])
+  for i in range(n):
+    p = p.copy()
+    p.fill_rect(i % w, 3, i % w + 4, 7, _colors[1])
+    p.set(rnd.randrange(w), rnd.randrange(h), rnd.choice(_colors))
+    result.append(p)
+  return result
+
+def _skip_blocks(data, pos):
+  # return the position after the data sub-blocks starting at pos
+  while ord(data[pos:pos + 1]):
+    pos += ord(data[pos:pos + 1]) + 1
+  return pos + 1
+
+def read_gif(filename):
+  """Return the frames of a GIF file written by FrameWriter as a list
+  of (pixels, duration), where pixels is the list of all pixels of the
+  animation after drawing the frame."""
+  data = open(filename, "rb").read()
+  w, h, flags = _struct.unpack("<HHB", data[6:11])
+  if data[:6] != b"GIF89a" or flags & 0x80:
+    raise ValueError("Unexpected GIF header")
+  canvas = _Image.new("RGB", (w, h))
+  result = []
+  duration = None
+  pos = 13
+  while data[pos:pos + 1] != b"\x3b":
+    if data[pos:pos + 1] == b"\x21":
+      if data[pos + 1:pos + 2] == b"\xf9":
+        duration = 10 * _struct.unpack("<H", data[pos + 4:pos + 6])[0]
+      pos = _skip_blocks(data, pos + 2)
+    elif data[pos:pos + 1] == b"\x2c":
+      x, y, fw, fh, flags = _struct.unpack("<HHHHB", data[pos + 1:pos + 10])
+      start = pos + 10
+      pos = start + (3 << ((flags & 7) + 1) if flags & 0x80 else 0)
+      pos = _skip_blocks(data, pos + 1)
+      # the frame on its own, as a GIF file of its size
+      frame = (b"GIF89a" + _struct.pack("<HHBBB", fw, fh, 0, 0, 0) +
+               b"\x2c" + _struct.pack("<HHHHB", 0, 0, fw, fh, flags) +
+               data[start:pos] + b"\x3b")
+      canvas.paste(_Image.open(_io.BytesIO(frame)).convert("RGB"), (x, y))
+      result.append((list(canvas.getdata()), duration))
+    else:
+      raise ValueError("Unexpected GIF block")
+  return result
+
+class FrameWriterTest(_unittest.TestCase):
+  """Writes animations and reads them back."""
+
+  def setUp(self):
+    self.tmpdir = _tempfile.mkdtemp()
+
+  def tearDown(self):
+    _shutil.rmtree(self.tmpdir)
+
+  def path(self, name):
+    return _os.path.join(self.tmpdir, name)
+
+  def test_gif(self):
+    pictures = frames(12)
+    for diff in (True, False):
+      filename = self.path("anim%d.gif" % diff)
+      n = _frames.save_animation(pictures, filename, 40, diff=diff)
+      self.assertEqual(n, 12)
+      result = read_gif(filename)
+      self.assertEqual(len(result), 12)
+      for p, (data, duration) in zip(pictures, result):
+        self.assertEqual(data, p.get_region())
+        self.assertEqual(duration, 40)
+
+  def test_gif_unchanged_frames(self):
+    a, b = frames(2)
+    filename = self.path("still.gif")
+    writer = _frames.FrameWriter(filename, 100)
+    for p, duration in ((a, 50), (a, 30), (b, None), (b, None), (a, 20)):
+      writer.add(p, duration)
+    self.assertEqual(writer.count(), 5)
+    writer.close()
+    result = read_gif(filename)
+    self.assertEqual([duration for data, duration in result], [80, 200, 20])
+    self.assertEqual([data for data, duration in result],
+                     [a.get_region(), b.get_region(), a.get_region()])
+
+  def test_directory(self):
+    pictures = frames(4)
+    pictures.insert(2, pictures[1])
+    target = self.path("frames")
+    with _frames.FrameWriter(target, format=".ppm") as writer:
+      for p in pictures:
+        writer.add(p)
+    names = sorted(_os.listdir(target))
+    self.assertEqual(names, ["frame%05d.ppm" % i for i in range(5)])
+    for p, name in zip(pictures, names):
+      q = _media.load_picture(_os.path.join(target, name))
+      self.assertEqual(q.get_region(), p.get_region())
+    self.assertTrue(_os.path.samefile(_os.path.join(target, names[1]),
+                                      _os.path.join(target, names[2])))
+
+  def test_tiled_picture(self):
+    p = frames(1)[0]
+    w, h = p.size()
+    t = _media.create_tiled_picture(w, h, (0, 0, 0), 8, 2)
+    for y in range(h):
+      for x in range(w):
+        t.set(x, y, p.get(x, y))
+    filename = self.path("tiled.gif")
+    _frames.save_animation([p, t], filename)
+    result = read_gif(filename)
+    self.assertEqual([data for data, duration in result], [p.get_region()])
+    self.assertEqual([duration for data, duration in result], [200])
+
+  def test_empty(self):
+    filename = self.path("empty.gif")
+    self.assertEqual(_frames.save_animation([], filename), 0)
+    self.assertFalse(_os.path.exists(filename))
+
+  def test_errors(self):
+    filename = self.path("error.gif")
+    writer = _frames.FrameWriter(filename)
+    writer.add(_media.create_picture(4, 3))
+    self.assertRaises(ValueError, writer.add, _media.create_picture(3, 4))
+    writer.close()
+    writer.close()
+    self.assertRaises(RuntimeError, writer.add, _media.create_picture(4, 3))
+    self.assertEqual(len(read_gif(filename)), 1)
+
+# --------------------------------------------------------------------
+
+if __name__ == "__main__":
+  _unittest.main()
+
+# --------------------------------------------------------------------